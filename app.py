@@ -1,117 +1,260 @@
+import argparse
+
 from repo.vector_repo.base import get_vector_db_client
+from settings import CANDIDATE_FUNCTION_LIMIT, CANDIDATE_MMR_LAMBDA, CODE_CONTEXT_TOKEN_BUDGET, INDEXING_CHECKPOINT_BATCH_SIZE, INDEXING_CHECKPOINT_PATH, \
+    INSTRUMENTATION_REPORT_PATH, LEXICAL_INDEX_PATH, MIN_FUNCTION_DESC_TOKEN_BUDGET, RETRIEVAL_MODE, SUMMARY_CONCURRENCY
 from utils.ai_agent.ai_agent import AIAgent, get_ai_agent
+from utils.call_graph import CallGraph
+from utils.code_context import get_code_context, get_summary_code
 from utils.codemap import CodeWorkspaceClient
-from utils.solver import break_dict_by_length
+from utils.indexing_checkpoint import IndexingCheckpoint
+from utils.indexing_pipeline import IndexingPipeline
+from utils.instrumentation import instrumentation
+from utils.lexical_index import LexicalDocument, get_lexical_index
+from utils.prompt_packer import pack_dict_by_tokens
+from utils.retrieval import check_retrieval_mode, get_candidate_functions, get_similar_functions
+from utils.scheduler import get_dependency_levels, run_level_wise
+from utils.symbol_index import get_class_name, get_short_name, split_symbol_name
 
 func_summary_map = {}
 func_short_summary_map = {}
 
-def generate_function_summaries(func, tree, ai_agent: AIAgent, workspace_client: CodeWorkspaceClient):
-    print("generating for func: ", func)
-    call_list = tree[func] if func in tree else []
-    func_name = func
-    class_name = ''
-    
-    # separating class name
-    if '.' in func:
-        class_name, func_name = func.split('.')
-        func_summary_map[class_name] = ''   # will update this after all the internal functions are summarized
+def generate_function_summaries(tree, ai_agent: AIAgent, workspace_client: CodeWorkspaceClient, class_method_map=None, on_summary=None):
+    # summarizing the functions level by level, so that the summaries of all the callees
+    # are available before a function is summarized. a class is summarized after all of its methods.
+    # on_summary(func, summary) is called as soon as a summary is generated
+    class_method_map = class_method_map or {}
+    tree = dict(tree)
+    for class_name, method_list in class_method_map.items():
+        tree[class_name] = sorted(set(tree.get(class_name, [])) | set(method_list))
+
+    levels = get_dependency_levels(tree)
+    levels = [[func for func in level if func not in func_summary_map] for level in levels]
 
-    call_list_desc_map = {}
-    if len(call_list):
+    def summarize(func):
+        print("generating for func: ", func)
+        if func in class_method_map:
+            return summarize_class(func)
+
+        # separating class name
+        class_name = get_class_name(func)
+        class_name = get_short_name(class_name) if class_name else ''
+
+        # callees in a cycle might not be summarized yet
+        call_list = tree[func] if func in tree else []
+        call_list_desc_map = {}
         for call_func in call_list:
-            if call_func not in func_summary_map:
-                generate_function_summaries(call_func,tree, ai_agent, workspace_client)
+            if call_func in func_summary_map:
                 call_list_desc_map[call_func] = func_summary_map[call_func]
 
-    function_code = workspace_client.fetch_function_code(func_name)
-    func_summary_map[func] = ai_agent.get_function_summary(function_code, call_list_desc_map, class_name)
+        function_code = get_summary_code(workspace_client, func, CODE_CONTEXT_TOKEN_BUDGET)
+        return ai_agent.get_function_summary(function_code, call_list_desc_map, class_name)
+
+    def summarize_class(class_name):
+        class_method_desc = {}
+        for class_method in class_method_map[class_name]:
+            if class_method in func_summary_map:
+                class_method_desc[class_method] = func_summary_map[class_method]
+
+        if len(class_method_desc):
+            return ai_agent.get_class_summary(split_symbol_name(class_name)[1], '', class_method_desc)
+
+        # if no internal methods are present then fetching the entire class code
+        class_code = get_summary_code(workspace_client, class_name, CODE_CONTEXT_TOKEN_BUDGET)
+        return ai_agent.get_class_summary(split_symbol_name(class_name)[1], class_code, {})
+
+    def update_summary(func, summary):
+        func_summary_map[func] = summary
+        if on_summary:
+            on_summary(func, summary)
+
+    run_level_wise(levels, summarize, update_summary, SUMMARY_CONCURRENCY)
+
+
+def get_workspace_symbols(code_tree):
+    # all the functions, their callees and the classes they belong to
+    symbols = set()
+    for func, call_list in code_tree.items():
+        symbols.add(func)
+        symbols.update(call_list)
 
+    for func in list(symbols):
+        if get_class_name(func):
+            symbols.add(get_class_name(func))
 
-def main():
+    return symbols
+
+
+def get_stale_symbols(call_graph: CallGraph, code_hash_map, indexed_hash_map):
+    '''
+    returns the symbols whose code has changed since they were indexed along with all of their
+    (transitive) callers, as the summary of a function depends on the summaries of its callees
+    '''
+    changed = [func for func, code_hash in code_hash_map.items() if indexed_hash_map.get(func, None) != code_hash]
+    stale_symbols = set(changed)
+    pending = changed
+    while len(pending):
+        # class summaries are generated from their method summaries, which makes the callers of the class stale as well
+        affected = call_graph.get_transitive_callers(pending)
+        affected.update(get_class_name(func) for func in pending if get_class_name(func))
+        pending = [func for func in affected if func not in stale_symbols]
+        stale_symbols.update(pending)
+
+    return stale_symbols
+
+
+def get_resumable_state(checkpoint: IndexingCheckpoint, call_graph: CallGraph, code_hash_map, indexed_hash_map, stale_symbols):
+    '''
+    state of the stale symbols which were summarized in the checkpointed run and are still valid, i.e. neither
+    the symbol nor any of its (transitive) callees has changed since then
+    '''
+    state_map = {func: state for func, state in checkpoint.load().items() if func in stale_symbols and state.summary is not None}
+    checkpoint_hash_map = dict(indexed_hash_map, **{func: state.code_hash for func, state in state_map.items()})
+    invalid_symbols = get_stale_symbols(call_graph, code_hash_map, checkpoint_hash_map)
+    return {func: state for func, state in state_map.items() if func not in invalid_symbols}
+
+
+def get_lexical_documents(workspace_client: CodeWorkspaceClient, row_list):
+    # name, signature, docstring and short description of every indexed function
+    document_list = []
+    for row in row_list:
+        symbol = workspace_client.symbol_index.get_symbol(row.function_name)
+        text_list = [symbol.signature, symbol.docstring] if symbol else []
+        document_list.append(LexicalDocument(row.function_name, row.function_name, '\n'.join(text_list + [row.short_desc or ''])))
+    return document_list
+
+
+def main(resume=False):
     # settings
     use_open_ai_agent = True
     generate_code_file = True
+    incremental_sync = True     # only re-index the functions which have changed since the last run
+    check_retrieval_mode(RETRIEVAL_MODE)
 
     workspace_client = CodeWorkspaceClient()
     ai_agent = get_ai_agent(debug=not use_open_ai_agent)
     db_client = get_vector_db_client()
 
-    # TODO: change the logic here
-    # only running the code below if the DB is empty
+    # without incremental sync the index is only built when the DB is empty
     all_data = db_client.fetch_all_data()
-    if not len(all_data):
+    code_tree = {}
+    if not len(all_data) or incremental_sync:
         # generate code tree
-        code_tree = workspace_client.generate_code_tree_for_workspace()
+        with instrumentation.stage("parse"):
+            call_graph = workspace_client.generate_call_graph()
+            code_tree = call_graph.to_tree()
         print("\033[1;32mcode tree generated\033[0m")
         print(code_tree)
 
-        # generate description for every function
-        for k, _ in code_tree.items():
-            if k not in func_summary_map:
-                generate_function_summaries(k, code_tree, ai_agent, workspace_client)
-
-        # generate description for every class
-        func_key_list = func_summary_map.keys()
-        for k, v in func_summary_map.items():
-            if v == '':
-                class_prefix = k + '.'
-                class_methods = [func for func in func_key_list if func.startswith(class_prefix)]
-                if len(class_methods):
-                    class_method_desc = {}
-                    for class_method in class_methods:
-                        class_method_desc[class_method] = func_summary_map[class_method]
-
-                    func_summary_map[k] = ai_agent.get_class_summary(k, '', class_method_desc)
-                else:
-                    # if no internal methods are present then fetching the entire class code
-                    class_code = workspace_client.fetch_function_code(k)
-                    func_summary_map[k] = ai_agent.get_class_summary(k, class_code, {})
-
-        # store the description in the vector database
-        for idx, (func, summary) in enumerate(func_summary_map.items()):
-            summary_vector = ai_agent.get_text_embedding(summary)
-            short_desc = ai_agent.generate_short_desc(summary)
-            data = dict(function_name=func, vector=summary_vector, short_desc=short_desc)
-            db_client.add_vector_data([data])
+        # diffing the workspace against the indexed functions
+        indexed_data = {row.function_name: row for row in all_data}
+        with instrumentation.stage("diff"):
+            workspace_symbols = get_workspace_symbols(code_tree)
+            code_hash_map = {func: workspace_client.get_code_hash(func) for func in workspace_symbols}
+            indexed_hash_map = {k: v.code_hash for k, v in indexed_data.items()}
+            stale_symbols = get_stale_symbols(call_graph, code_hash_map, indexed_hash_map)
+        print(f"\033[1;32m{len(stale_symbols)} of {len(workspace_symbols)} functions need to be indexed\033[0m")
+
+        db_client.delete_vectors(list(indexed_data.keys() - workspace_symbols))
+
+        # reusing the summaries of the functions which haven't changed
+        for func in workspace_symbols - stale_symbols:
+            func_summary_map[func] = indexed_data[func].summary or ''
+
+        with IndexingCheckpoint(INDEXING_CHECKPOINT_PATH, INDEXING_CHECKPOINT_BATCH_SIZE) as checkpoint:
+            resumed_state_map = get_resumable_state(checkpoint, call_graph, code_hash_map, indexed_hash_map, stale_symbols) if resume else {}
+            if resume:
+                print(f"\033[1;32mresuming {len(resumed_state_map)} of {len(stale_symbols)} functions from the checkpoint\033[0m")
+            else:
+                checkpoint.clear()
+
+            # generate description for every function and class, the stale ones are indexed (short description,
+            # embedding and DB write) while the rest of the functions are being summarized
+            def index_summary(func, summary):
+                if func in stale_symbols:
+                    pipeline.submit(func, summary, code_hash_map.get(func, None))
+
+            if not len(all_data):
+                db_client.begin_bulk_load()
+            with IndexingPipeline(ai_agent, db_client, checkpoint) as pipeline:
+                # finishing the functions which were summarized (but not stored) in the failed run
+                for func, state in resumed_state_map.items():
+                    func_summary_map[func] = state.summary
+                    # the store might not have been flushed after writing it
+                    is_stored = state.stored and func in indexed_data and (indexed_data[func].summary, indexed_data[func].code_hash) == (state.summary, state.code_hash)
+                    if not is_stored:
+                        pipeline.submit(func, state.summary, state.code_hash, state.short_desc, state.vector)
+
+                with instrumentation.stage("summarize"):
+                    generate_function_summaries(code_tree, ai_agent, workspace_client, call_graph.class_method_map, index_summary)
+
+            with instrumentation.stage("db_write"):
+                if not len(all_data):
+                    db_client.rebuild_vector_index()
+                db_client.flush()
+
+            # the run is complete, nothing left to resume
+            checkpoint.clear()
 
         all_data = db_client.fetch_all_data()
 
     print("\033[1;32mcode tree loaded in the db\033[0m")
+
+    # the lexical index is rebuilt only when the indexed functions have changed
+    lexical_index, row_map = None, {row.function_name: row for row in all_data}
+    if RETRIEVAL_MODE != 'vector':
+        with instrumentation.stage("lexical_index"):
+            lexical_index = get_lexical_index(LEXICAL_INDEX_PATH, get_lexical_documents(workspace_client, all_data))
     
     # take task input and convert into steps
-    function_desc_map = {}
-    for row in all_data:
-        function_desc_map[row.function_name] = row.short_desc
-
     task = input("enter task: ")
     # task = "write the code to take a text input and print a vector embedding generated from it"
-    task_list = ai_agent.get_task_breakup(task, {})
+    with instrumentation.stage("task_breakup"):
+        task_list = ai_agent.get_task_breakup(task, {})
     print("\033[1;32minitial task list:\033[0m")
     for t in task_list:
         print(t)
 
-    function_desc_map_breakup_list = break_dict_by_length(function_desc_map, 2500)
-    required_functions = []
-    for func in function_desc_map_breakup_list:
-        function_list = ai_agent.update_task_list_based_on_function_desc(task_list, func)
-        if function_list and len(function_list):
-            for helpful_function in function_list:
-                if helpful_function != 'NONE':
-                    required_functions.append(helpful_function)
-
-    # print('=> Final list of important functions')
-    combined_instructions = ''
-    for t in required_functions:
-        # print(t)
-        combined_instructions += t + '\n'
+    # only the functions closest to the task list are checked by the LLM
+    with instrumentation.stage("retrieval"):
+        # the lexical only mode skips the embedding call
+        task_embedding_list = ai_agent.get_text_embeddings(task_list) if RETRIEVAL_MODE != 'lexical' else None
+        candidate_function_list = get_candidate_functions(db_client, task_embedding_list, CANDIDATE_FUNCTION_LIMIT, CANDIDATE_MMR_LAMBDA,
+                                                          lexical_index, task_list, row_map)
+    function_desc_map = {}
+    for row in candidate_function_list:
+        function_desc_map[row.function_name] = row.short_desc
+
+    # packing the function descriptions in as few prompts as the context window allows
+    token_budget = ai_agent.get_function_desc_token_budget(task_list)
+    if token_budget < MIN_FUNCTION_DESC_TOKEN_BUDGET:
+        print(f"task list leaves {token_budget} tokens for the function descriptions, using {MIN_FUNCTION_DESC_TOKEN_BUDGET} instead")
+        token_budget = MIN_FUNCTION_DESC_TOKEN_BUDGET
+    function_desc_chunk_list = pack_dict_by_tokens(function_desc_map, token_budget)
+    for idx, chunk in enumerate(function_desc_chunk_list):
+        print(f"prompt {idx + 1}/{len(function_desc_chunk_list)}: {len(chunk.items)} functions, {chunk.token_count}/{chunk.token_budget} tokens ({chunk.fill_ratio:.0%} full)")
+
+    with instrumentation.stage("task_update"):
+        required_functions = []
+        for chunk in function_desc_chunk_list:
+            function_list = ai_agent.update_task_list_based_on_function_desc(task_list, chunk.items)
+            if function_list and len(function_list):
+                for helpful_function in function_list:
+                    if helpful_function != 'NONE':
+                        required_functions.append(helpful_function)
+
+        # print('=> Final list of important functions')
+        combined_instructions = ''
+        for t in required_functions:
+            # print(t)
+            combined_instructions += t + '\n'
     
-    combined_task_list = ''
-    for t in task_list:
-        combined_task_list += t + '\n'
+        combined_task_list = ''
+        for t in task_list:
+            combined_task_list += t + '\n'
     
-    task_list = ai_agent.regenerate_task_list(combined_task_list, combined_instructions)
-    task_list = ai_agent.filter_numbered_list(task_list)
+        task_list = ai_agent.regenerate_task_list(combined_task_list, combined_instructions)
+        task_list = ai_agent.filter_numbered_list(task_list)
 
     # derive code for the steps
     # create a new code file
@@ -122,36 +265,38 @@ def main():
     final_code = ''
 
     if generate_code_file:
-        for task in task_list:
-            task_embedding = ai_agent.get_text_embedding(task)
-            top_similar_function = db_client.fetch_similar_vector_data(task_embedding, 3)
-            function_code_list = {}
-            class_init_list = {}
-            for func in top_similar_function:
-                function_code = workspace_client.fetch_function_code(func.function_name)
-                function_code_list[func.function_name] = function_code
-                if '.' in func.function_name:
-                    code = workspace_client.search_directory_for_class_init("./", class_name=func.function_name.split('.')[0])
-                    # for abstract classes there won't be an init
-                    if code:
-                        class_init_list[func.function_name] = code.strip()
-
-
-            generated_code = ai_agent.generate_task_code(task, function_code_list, class_init_list)
-
-            while "help: " in generated_code:
-                print('task - ', task)
-                help_input = input('provide for info regarding this query: \n' + generated_code + ': ')
-                generated_code = ai_agent.generate_task_code(task + f'given answer to this query {generated_code}: ' + help_input, function_code_list)
-
-            # adding the code to the file
-            final_code += '\n'
-            final_code += generated_code
+        with instrumentation.stage("code_generation"):
+            task_embedding_list = ai_agent.get_text_embeddings(task_list) if RETRIEVAL_MODE != 'lexical' else None
+            similar_function_list = get_similar_functions(db_client, task_embedding_list, 3, lexical_index, task_list, row_map)
+            for task, top_similar_function in zip(task_list, similar_function_list):
+                # the retrieved functions within the token budget, their callees only as skeletons
+                function_code_list = get_code_context(workspace_client, [func.function_name for func in top_similar_function],
+                                                      CODE_CONTEXT_TOKEN_BUDGET, code_tree)
+                class_init_list = {}
+                for func in top_similar_function:
+                    class_name = get_class_name(func.function_name)
+                    if class_name:
+                        code = workspace_client.find_class_usage(class_name)
+                        # for abstract classes there won't be an init
+                        if code:
+                            class_init_list[func.function_name] = code.strip()
+
+
+                generated_code = ai_agent.generate_task_code(task, function_code_list, class_init_list)
+
+                while "help: " in generated_code:
+                    print('task - ', task)
+                    help_input = input('provide for info regarding this query: \n' + generated_code + ': ')
+                    generated_code = ai_agent.generate_task_code(task + f'given answer to this query {generated_code}: ' + help_input, function_code_list)
+
+                # adding the code to the file
+                final_code += '\n'
+                final_code += generated_code
 
-        
         # fixing the code
         print("\033[1;32mfixing minor issues\033[0m")
-        final_code = ai_agent.fix_code_issues(final_code)
+        with instrumentation.stage("code_fix"):
+            final_code = ai_agent.fix_code_issues(final_code)
         
         with open("generated_code.py", "w") as f:
             f.write("\n")
@@ -159,4 +304,12 @@ def main():
         print("\033[1;32moutput file generated\033[0m")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', action='store_true', help="resume the indexing run which failed, from its checkpoint")
+    args = parser.parse_args()
+
+    try:
+        main(resume=args.resume)
+    finally:
+        instrumentation.print_report()
+        instrumentation.save_report(INSTRUMENTATION_REPORT_PATH)
\ No newline at end of file
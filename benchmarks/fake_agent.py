@@ -0,0 +1,81 @@
+import hashlib
+import re
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from settings import VECTOR_EMBEDDING_DIM
+from utils.ai_agent.ai_agent import TestAIAgent
+
+
+def get_hash_seed(text):
+    return int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+
+
+@lru_cache(maxsize=65536)
+def get_word_vector(word):
+    return np.random.default_rng(get_hash_seed(word)).standard_normal(VECTOR_EMBEDDING_DIM).astype(np.float32)
+
+
+def get_hash_embedding(text):
+    '''
+    sum of the hash seeded vectors of the words of the text (normalized), so that texts sharing
+    words are closer to each other. the same text always gets the same embedding
+    '''
+    vector = np.zeros(VECTOR_EMBEDDING_DIM, dtype=np.float32)
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        vector += get_word_vector(word)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FakeAIAgent(TestAIAgent):
+    '''
+    deterministic agent for offline benchmarks, every model call sleeps for the given latency (in seconds)
+    and the responses only depend on the input. embeddings are seeded by the words of the text
+    '''
+    def __init__(self, latency=0, embedding_latency=0, max_depth=3):
+        self.latency = latency
+        self.embedding_latency = embedding_latency
+        self.max_depth = max_depth
+        self.call_count = 0
+
+    def _wait(self, latency):
+        self.call_count += 1
+        if latency:
+            time.sleep(latency)
+
+    def is_breakdown_of_task_needed(self, task: str):
+        self._wait(self.latency)
+        # the root task is always broken down, a quarter of the sub-tasks are leaves
+        depth = task.count('.')
+        return depth < self.max_depth and (depth == 0 or get_hash_seed(task) % 4 != 0)
+
+    def breakdown_into_subtask(self, task: str):
+        self._wait(self.latency)
+        return ';'.join(f"{task}.{idx}" for idx in range(2 + get_hash_seed(task) % 2))
+
+    def solve_task(self, task: str, data=None):
+        self._wait(self.latency)
+        return f"solved {task}\n"
+
+    def get_function_summary(self, code: str, dict: dict, class_name: str):
+        self._wait(self.latency)
+        first_line = code.strip().split('\n')[0] if code.strip() else ''
+        return f"{class_name} {first_line} uses {' '.join(sorted(dict.keys()))}".strip()
+
+    def get_class_summary(self, class_name, class_code, dict):
+        self._wait(self.latency)
+        return f"class {class_name} with {' '.join(sorted(dict.keys()))}"
+
+    def get_text_embeddings(self, texts):
+        self._wait(self.embedding_latency)
+        embeddings = np.empty((len(texts), VECTOR_EMBEDDING_DIM), dtype=np.float32)
+        for idx, text in enumerate(texts):
+            embeddings[idx] = get_hash_embedding(text)
+        return embeddings
+
+    def generate_short_desc(self, function_summary):
+        self._wait(self.latency)
+        return function_summary[:80]
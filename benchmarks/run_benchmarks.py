@@ -0,0 +1,231 @@
+'''
+offline benchmarks of the indexing and query pipeline, run from the repo root with
+    python -m benchmarks.run_benchmarks --size small
+results are saved as json and compared against the baseline (if present), the exit code is 1
+if any benchmark is slower than the baseline by more than the threshold
+'''
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict, replace
+
+import numpy as np
+
+from benchmarks.fake_agent import FakeAIAgent
+from benchmarks.synthetic_repo import CALL_GRAPH_SHAPE_LIST, WORKSPACE_SIZE_MAP, generate_workspace
+from utils.codemap import CodeWorkspaceClient
+from utils.lexical_index import LexicalDocument, LexicalIndex
+from utils.task_tree import TaskNode
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+DEFAULT_BASELINE_PATH = os.path.join(RESULTS_DIR, 'baseline.json')
+DEFAULT_OUTPUT_PATH = os.path.join(RESULTS_DIR, 'latest.json')
+
+
+def run_timed(func, repeat):
+    # func returns the number of operations it did, the progress printed by the pipeline is discarded
+    time_list, ops = [], 0
+    for _ in range(repeat):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start_time = time.perf_counter()
+            ops = func()
+            time_list.append(time.perf_counter() - start_time)
+    return dict(min=min(time_list), median=statistics.median(time_list), ops=ops)
+
+
+class BenchmarkContext:
+    '''
+    synthetic workspace and the scratch directory (symbol index, vector store) shared by the benchmarks
+    '''
+    def __init__(self, work_dir, config, latency):
+        self.work_dir = work_dir
+        self.workspace_path = os.path.join(work_dir, 'workspace')
+        self.symbol_count = generate_workspace(self.workspace_path, config)
+        self.index_path = os.path.join(work_dir, 'symbol_index.json')
+        self.latency = latency
+        self.client = CodeWorkspaceClient(self.workspace_path, self.index_path)
+        self.call_graph = self.client.generate_call_graph()
+
+
+def bench_code_tree_cold(ctx: BenchmarkContext):
+    if os.path.exists(ctx.index_path):
+        os.remove(ctx.index_path)
+    return len(CodeWorkspaceClient(ctx.workspace_path, ctx.index_path).generate_code_tree_for_workspace())
+
+
+def bench_code_tree_warm(ctx: BenchmarkContext):
+    return len(CodeWorkspaceClient(ctx.workspace_path, ctx.index_path).generate_code_tree_for_workspace())
+
+
+def bench_fetch_function_code(ctx: BenchmarkContext):
+    for name in ctx.call_graph.names:
+        ctx.client.fetch_function_code(name)
+    return len(ctx.call_graph)
+
+
+def bench_summarize(ctx: BenchmarkContext):
+    import app
+
+    app.func_summary_map.clear()
+    app.generate_function_summaries(ctx.call_graph.to_tree(), FakeAIAgent(ctx.latency), ctx.client, ctx.call_graph.class_method_map)
+    return len(app.func_summary_map)
+
+
+def _get_vector_db(ctx: BenchmarkContext, reset=False):
+    from repo.vector_repo.faiss_db import FaissVectorDB
+
+    index_dir = os.path.join(ctx.work_dir, 'faiss')
+    if reset:
+        shutil.rmtree(index_dir, ignore_errors=True)
+    return FaissVectorDB(index_dir)
+
+
+def bench_vector_upsert(ctx: BenchmarkContext):
+    name_list = list(ctx.call_graph.names)
+    vector_list = FakeAIAgent().get_text_embeddings(name_list)
+    data_list = [dict(function_name=name, vector=vector, short_desc=name, summary=name, code_hash='')
+                 for name, vector in zip(name_list, vector_list)]
+    db_client = _get_vector_db(ctx, reset=True)
+    db_client.upsert_vector_data(data_list)
+    db_client.flush()
+    return len(data_list)
+
+
+def bench_vector_query(ctx: BenchmarkContext):
+    db_client = _get_vector_db(ctx)
+    if not len(db_client.fetch_all_data()):
+        bench_vector_upsert(ctx)
+        db_client = _get_vector_db(ctx)
+
+    query_list = [name.replace('_', ' ') for name in ctx.call_graph.names[:200]]
+    query_matrix = FakeAIAgent().get_text_embeddings(query_list)
+    result_list = db_client.fetch_similar_vector_data_batch(query_matrix, 10)
+    return sum(len(rows) for rows in result_list)
+
+
+def bench_lexical_query(ctx: BenchmarkContext):
+    # building the index and searching it, the same queries as the vector benchmark
+    document_list = []
+    for name in ctx.call_graph.names:
+        symbol = ctx.client.symbol_index.get_symbol(name)
+        document_list.append(LexicalDocument(name, name, f"{symbol.signature}\n{symbol.docstring}" if symbol else ''))
+    lexical_index = LexicalIndex.build(document_list)
+
+    query_list = [name.replace('_', ' ') for name in ctx.call_graph.names[:200]]
+    return sum(len(matches) for matches in lexical_index.search_batch(query_list, 10))
+
+
+def bench_solve(ctx: BenchmarkContext):
+    from utils.solver import solve
+
+    ai_agent = FakeAIAgent(ctx.latency)
+    solve(TaskNode("benchmark task"), ai_agent=ai_agent)
+    return ai_agent.call_count
+
+
+BENCHMARK_MAP = {
+    'code_tree_cold': bench_code_tree_cold,
+    'code_tree_warm': bench_code_tree_warm,
+    'fetch_function_code': bench_fetch_function_code,
+    'summarize': bench_summarize,
+    'vector_upsert': bench_vector_upsert,
+    'vector_query': bench_vector_query,
+    'lexical_query': bench_lexical_query,
+    'solve': bench_solve,
+}
+VECTOR_BENCHMARK_LIST = ['vector_upsert', 'vector_query']
+
+
+def compare_results(result_map, baseline_map, threshold, min_delta):
+    # names of the benchmarks which are slower than the baseline by more than the threshold (and min_delta seconds)
+    regression_list = []
+    print(f"{'benchmark':<22}{'min (s)':>12}{'baseline (s)':>14}{'change':>10}")
+    for name, result in result_map.items():
+        baseline = baseline_map.get(name, None)
+        if not baseline or not baseline["min"]:
+            print(f"{name:<22}{result['min']:>12.4f}{'-':>14}{'-':>10}")
+            continue
+
+        change = result["min"] / baseline["min"] - 1
+        print(f"{name:<22}{result['min']:>12.4f}{baseline['min']:>14.4f}{change:>+10.1%}")
+        if change > threshold and result["min"] - baseline["min"] > min_delta:
+            regression_list.append(name)
+    return regression_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline benchmarks with a fake agent and a synthetic workspace")
+    parser.add_argument('--size', choices=list(WORKSPACE_SIZE_MAP.keys()), default='small')
+    parser.add_argument('--shape', choices=CALL_GRAPH_SHAPE_LIST, default=None, help="call graph shape of the workspace")
+    parser.add_argument('--latency', type=float, default=0, help="simulated latency of every model call (in seconds)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', default=None, help="comma separated list of the benchmarks to run")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="save the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed slowdown compared to the baseline")
+    parser.add_argument('--min-delta', type=float, default=0.005, help="slowdowns smaller than this (in seconds) are ignored")
+    args = parser.parse_args()
+
+    config = WORKSPACE_SIZE_MAP[args.size]
+    if args.shape:
+        config = replace(config, shape=args.shape)
+
+    name_list = args.only.split(',') if args.only else list(BENCHMARK_MAP.keys())
+    for name in name_list:
+        if name not in BENCHMARK_MAP:
+            parser.error(f"unknown benchmark: {name}")
+
+    try:
+        import faiss
+    except ImportError:
+        print("faiss is not installed, skipping the vector benchmarks")
+        name_list = [name for name in name_list if name not in VECTOR_BENCHMARK_LIST]
+
+    work_dir = tempfile.mkdtemp(prefix='hal_benchmark_')
+    try:
+        ctx = BenchmarkContext(work_dir, config, args.latency)
+        print(f"workspace with {ctx.symbol_count} functions, {len(ctx.call_graph)} graph nodes and {ctx.call_graph.edge_count} edges")
+
+        result_map = {}
+        for name in name_list:
+            result_map[name] = run_timed(lambda: BENCHMARK_MAP[name](ctx), args.repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = dict(
+        config=dict(size=args.size, latency=args.latency, repeat=args.repeat, workspace=asdict(config)),
+        environment=dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine()),
+        results=result_map,
+    )
+
+    baseline_map = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline["config"] == output["config"]:
+            baseline_map = baseline["results"]
+        else:
+            print("baseline was recorded with a different config, not comparing")
+    regression_list = compare_results(result_map, baseline_map, args.threshold, args.min_delta)
+
+    for path in [args.output] + ([args.baseline] if args.save_baseline else []):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if len(regression_list):
+        print(f"\033[1;31mregression in: {', '.join(regression_list)}\033[0m")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
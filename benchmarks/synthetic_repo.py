@@ -0,0 +1,114 @@
+import os
+import random
+from dataclasses import dataclass
+
+
+CALL_GRAPH_SHAPE_LIST = ['random', 'chain', 'hub']
+MODULES_PER_PACKAGE = 10
+
+WORD_LIST = ['load', 'parse', 'vector', 'embedding', 'summary', 'token', 'cache', 'index', 'query', 'task',
+             'function', 'class', 'file', 'tree', 'node', 'batch', 'request', 'response', 'score', 'rank']
+
+
+@dataclass
+class WorkspaceConfig:
+    module_count: int = 20
+    functions_per_module: int = 10
+    classes_per_module: int = 2
+    methods_per_class: int = 5
+    fan_out: int = 3                # number of functions called by every function
+    shape: str = 'random'           # random, chain or hub
+    body_lines: int = 5             # filler lines in every function
+    seed: int = 0
+
+
+# workspace sizes used by the benchmarks
+WORKSPACE_SIZE_MAP = {
+    'small': WorkspaceConfig(module_count=10, functions_per_module=8),
+    'medium': WorkspaceConfig(module_count=50, functions_per_module=15, classes_per_module=3),
+    'large': WorkspaceConfig(module_count=200, functions_per_module=20, classes_per_module=4, methods_per_class=8),
+}
+
+
+def get_module_path(module_idx):
+    return f"pkg_{module_idx // MODULES_PER_PACKAGE}", f"mod_{module_idx}"
+
+
+def _pick_callees(rng, config: WorkspaceConfig, function_list, idx):
+    # callees are always picked from the functions defined before, so the call graph is acyclic
+    if idx == 0:
+        return []
+    if config.shape == 'chain':
+        return [function_list[idx - 1]]
+    if config.shape == 'hub':
+        hub_count = max(1, len(function_list) // 50)
+        return rng.sample(function_list[:min(hub_count, idx)], min(config.fan_out, hub_count, idx))
+    return rng.sample(function_list[:idx], min(config.fan_out, idx))
+
+
+def generate_workspace(path, config: WorkspaceConfig):
+    '''
+    writes a python workspace with config.module_count modules to the given path and returns the
+    number of functions and methods in it. functions call functions of the same and other modules
+    (shape decides how the calls are spread) and methods call other methods of their class
+    '''
+    if config.shape not in CALL_GRAPH_SHAPE_LIST:
+        raise ValueError(f"unsupported call graph shape: {config.shape}")
+
+    rng = random.Random(config.seed)
+    function_list = []  # (module idx, function name) in the order of definition
+    for module_idx in range(config.module_count):
+        for func_idx in range(config.functions_per_module):
+            function_list.append((module_idx, f"{rng.choice(WORD_LIST)}_{rng.choice(WORD_LIST)}_{module_idx}_{func_idx}"))
+
+    callee_map = {}
+    for idx, func in enumerate(function_list):
+        callee_map[func] = _pick_callees(rng, config, function_list, idx)
+
+    symbol_count = 0
+    for module_idx in range(config.module_count):
+        package_name, module_name = get_module_path(module_idx)
+        os.makedirs(os.path.join(path, package_name), exist_ok=True)
+
+        module_function_list = [func for func in function_list if func[0] == module_idx]
+        import_set = set()
+        for func in module_function_list:
+            for callee_module_idx, callee_name in callee_map[func]:
+                if callee_module_idx != module_idx:
+                    import_set.add("from {}.{} import {}".format(*get_module_path(callee_module_idx), callee_name))
+
+        lines = sorted(import_set) + ['', '']
+        for func in module_function_list:
+            lines += _get_function_lines(rng, config, func[1], [c[1] for c in callee_map[func]], indent='')
+            symbol_count += 1
+
+        for class_idx in range(config.classes_per_module):
+            class_name = f"{rng.choice(WORD_LIST).title()}{rng.choice(WORD_LIST).title()}{module_idx}x{class_idx}"
+            lines += [f"class {class_name}:", f"    '''{rng.choice(WORD_LIST)} {rng.choice(WORD_LIST)} helper'''", ""]
+            method_list = [f"{rng.choice(WORD_LIST)}_{method_idx}" for method_idx in range(config.methods_per_class)]
+            for method_idx, method_name in enumerate(method_list):
+                callee_list = ['self.' + m for m in method_list[:method_idx][-config.fan_out:]]
+                if len(module_function_list):
+                    callee_list.append(rng.choice(module_function_list)[1])
+                lines += _get_function_lines(rng, config, method_name, callee_list, indent='    ', is_method=True)
+                symbol_count += 1
+
+        with open(os.path.join(path, package_name, module_name + '.py'), 'w') as f:
+            f.write('\n'.join(lines))
+
+    return symbol_count
+
+
+def _get_function_lines(rng, config: WorkspaceConfig, name, callee_list, indent, is_method=False):
+    params = 'self, value' if is_method else 'value'
+    lines = [
+        f"{indent}def {name}({params}):",
+        f"{indent}    '''{' '.join(rng.choice(WORD_LIST) for _ in range(6))}'''",
+        f"{indent}    result = value",
+    ]
+    for line_idx in range(config.body_lines):
+        lines.append(f"{indent}    result = (result * {line_idx + 3} + {rng.randint(0, 100)}) % 1000003")
+    for callee in callee_list:
+        lines.append(f"{indent}    result += {callee}(result)")
+    lines += [f"{indent}    return result", "", ""]
+    return lines
@@ -1,3 +1,19 @@
+from dataclasses import dataclass
+
+from settings import VECTOR_DB
+
+
+# row returned by the vector stores which don't have their own table model
+@dataclass
+class VectorRecord:
+    id: int
+    function_name: str
+    short_desc: str
+    summary: str
+    code_hash: str
+    vector: list = None
+
+
 class VectorDB:
     def __init__(self):
         pass
@@ -5,12 +21,49 @@ class VectorDB:
     def add_vector_data(self, **kwargs):
         pass
 
+    # inserts the rows, replacing the existing rows with the same function name
+    def upsert_vector_data(self, **kwargs):
+        pass
+
     def fetch_similar_vector_data(self, **kwargs):
         pass
 
+    # returns the list of similar rows for every query vector
+    def fetch_similar_vector_data_batch(self, **kwargs):
+        pass
+
+    def fetch_all_data(self):
+        pass
+
+    # function name -> vector of the given functions, for the rows returned without their vectors
+    def fetch_vectors(self, function_names):
+        function_name_set = set(function_names)
+        return {row.function_name: row.vector for row in self.fetch_all_data() if row.function_name in function_name_set and row.vector is not None}
+
     def delete_vector(self, **kwargs):
         pass
 
+    # deletes the rows of all the given functions at once
+    def delete_vectors(self, function_names):
+        for function_name in function_names:
+            self.delete_vector(function_name)
+
+    # called before loading an empty store, for indexes which are cheaper to build after the load
+    def begin_bulk_load(self):
+        pass
+
+    # called after a bulk load, for indexes which depend on the data present while building them
+    def rebuild_vector_index(self):
+        pass
+
+    # persists the writes of the stores which don't save every change, called once the indexing is done
+    def flush(self):
+        pass
+
 def get_vector_db_client(debug=False):
+    if VECTOR_DB == 'faiss':
+        from repo.vector_repo.faiss_db import FaissVectorDB
+        return FaissVectorDB()
+
     from repo.vector_repo.pgvector import PgVectorDB
     return PgVectorDB()
\ No newline at end of file
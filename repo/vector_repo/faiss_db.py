@@ -0,0 +1,250 @@
+import json
+import os
+from typing import List
+
+import faiss
+import numpy as np
+
+from repo.vector_repo.base import VectorDB, VectorRecord
+from settings import FAISS_INDEX_DIR, FAISS_INDEX_TYPE, FAISS_IVF_LISTS, FAISS_NPROBE, FAISS_PQ_SUBQUANTIZERS, FAISS_USE_MMAP, \
+    HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, HNSW_M, VECTOR_DISTANCE_METRIC, VECTOR_EMBEDDING_DIM
+
+FAISS_INDEX_TYPE_LIST = ['flat', 'hnsw', 'ivfpq']
+FAISS_METRIC_MAP = {
+    'inner_product': faiss.METRIC_INNER_PRODUCT,
+    'cosine': faiss.METRIC_INNER_PRODUCT,   # vectors are normalized before adding and searching
+    'l2': faiss.METRIC_L2,
+}
+# the index is compacted on save once this fraction of its vectors are deleted
+MAX_DELETED_FRACTION = 0.2
+
+
+class FaissVectorDB(VectorDB):
+    '''
+    in-process vector store, the faiss index and a metadata table (function name, description etc.)
+    are saved in the local cache directory after every write
+    '''
+    def __init__(self, index_dir=FAISS_INDEX_DIR):
+        if VECTOR_DISTANCE_METRIC not in FAISS_METRIC_MAP:
+            raise ValueError(f"unsupported distance metric: {VECTOR_DISTANCE_METRIC}")
+        if FAISS_INDEX_TYPE not in FAISS_INDEX_TYPE_LIST:
+            raise ValueError(f"unsupported faiss index type: {FAISS_INDEX_TYPE}")
+
+        self.index_path = os.path.join(index_dir, 'index.faiss')
+        self.metadata_path = os.path.join(index_dir, 'metadata.json')
+        self.metric = FAISS_METRIC_MAP[VECTOR_DISTANCE_METRIC]
+
+        self.index = None
+        self.is_mmapped = False
+        self.record_map = {}        # id -> VectorRecord (without the vector)
+        self.function_id_map = {}   # function name -> id
+        self.deleted_id_set = set() # ids removed from the metadata but still present in the index
+        self.next_id = 0
+        self.is_dirty = False       # modified since the last save, written by flush
+        self._load()
+
+    def _create_index(self, vector_count=0):
+        if FAISS_INDEX_TYPE == 'hnsw':
+            index = faiss.IndexHNSWFlat(VECTOR_EMBEDDING_DIM, HNSW_M, self.metric)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        elif FAISS_INDEX_TYPE == 'ivfpq' and vector_count >= self.ivfpq_training_size:
+            quantizer = faiss.IndexFlat(VECTOR_EMBEDDING_DIM, self.metric)
+            index = faiss.IndexIVFPQ(quantizer, VECTOR_EMBEDDING_DIM, FAISS_IVF_LISTS, FAISS_PQ_SUBQUANTIZERS, 8, self.metric)
+            # ivf indexes store the ids themselves, the direct map is needed for reconstructing
+            # and removing vectors by their id
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            return index
+        else:
+            # ivfpq needs enough vectors to train on, until then a flat index is used
+            index = faiss.IndexFlat(VECTOR_EMBEDDING_DIM, self.metric)
+
+        return faiss.IndexIDMap2(index)
+
+    @property
+    def ivfpq_training_size(self):
+        # minimum number of training points suggested by faiss for the coarse and the product quantizer
+        return max(FAISS_IVF_LISTS, 256) * 39
+
+    def _load(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.metadata_path)):
+            self.index = self._create_index()
+            return
+
+        if FAISS_USE_MMAP:
+            try:
+                self.index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                self.is_mmapped = True
+            except RuntimeError:
+                # not every index type can be memory mapped
+                self.index = faiss.read_index(self.index_path)
+        else:
+            self.index = faiss.read_index(self.index_path)
+
+        with open(self.metadata_path, 'r') as f:
+            metadata = json.load(f)
+
+        self.next_id = metadata["next_id"]
+        self.deleted_id_set = set(metadata["deleted_id_list"])
+        for id, function_name, short_desc, summary, code_hash in metadata["record_list"]:
+            self.record_map[id] = VectorRecord(id, function_name, short_desc, summary, code_hash)
+            self.function_id_map[function_name] = id
+
+    def _ensure_writable(self):
+        # memory mapped indexes are read only, loading the index in memory before modifying it
+        if self.is_mmapped:
+            self.index = faiss.read_index(self.index_path)
+            self.is_mmapped = False
+
+    def save(self):
+        if len(self.deleted_id_set) > MAX_DELETED_FRACTION * max(self.index.ntotal, 1):
+            self._rebuild_index()
+
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        self.is_dirty = False
+        faiss.write_index(self.index, self.index_path + '.tmp')
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+        metadata = {
+            "next_id": self.next_id,
+            "deleted_id_list": sorted(self.deleted_id_set),
+            "record_list": [[r.id, r.function_name, r.short_desc, r.summary, r.code_hash] for r in self.record_map.values()]
+        }
+        with open(self.metadata_path + '.tmp', 'w') as f:
+            json.dump(metadata, f)
+        os.replace(self.metadata_path + '.tmp', self.metadata_path)
+
+    def _prepare_vectors(self, vector_list):
+        vectors = np.ascontiguousarray(np.asarray(vector_list, dtype=np.float32).reshape(-1, VECTOR_EMBEDDING_DIM))
+        if VECTOR_DISTANCE_METRIC == 'cosine':
+            vectors = vectors.copy()
+            faiss.normalize_L2(vectors)
+        return vectors
+
+    def _reconstruct(self, id):
+        try:
+            return self.index.reconstruct(int(id))
+        except RuntimeError:
+            return None
+
+    def _remove_ids(self, id_list):
+        for id in id_list:
+            function_name = self.record_map.pop(id).function_name
+            self.function_id_map.pop(function_name, None)
+
+        try:
+            self.index.remove_ids(np.array(id_list, dtype=np.int64))
+        except RuntimeError:
+            # hnsw doesn't support removal, the ids are filtered out while searching
+            self.deleted_id_set.update(id_list)
+
+    def _rebuild_index(self):
+        id_list = list(self.record_map.keys())
+        vector_list = [self._reconstruct(id) for id in id_list]
+        if len(id_list) and any(vector is None for vector in vector_list):
+            print("unable to reconstruct the vectors, skipping the rebuild of the index")
+            return
+
+        self.index = self._create_index(len(id_list))
+        self.is_mmapped = False
+        self.deleted_id_set = set()
+        if len(id_list):
+            vectors = np.vstack(vector_list).astype(np.float32)
+            if not self.index.is_trained:
+                self.index.train(vectors)
+            self.index.add_with_ids(vectors, np.array(id_list, dtype=np.int64))
+
+    def add_vector_data(self, data_list: List[dict]):
+        self.upsert_vector_data(data_list)
+
+    def upsert_vector_data(self, data_list: List[dict]):
+        if not len(data_list):
+            return
+
+        self._ensure_writable()
+        data_map = {data['function_name']: data for data in data_list}
+        existing_id_list = [self.function_id_map[name] for name in data_map.keys() if name in self.function_id_map]
+        if len(existing_id_list):
+            self._remove_ids(existing_id_list)
+
+        id_list = []
+        for function_name, data in data_map.items():
+            id = self.next_id
+            self.next_id += 1
+            self.record_map[id] = VectorRecord(id, function_name, data.get('short_desc', None), data.get('summary', None), data.get('code_hash', None))
+            self.function_id_map[function_name] = id
+            id_list.append(id)
+
+        vectors = self._prepare_vectors([data['vector'] for data in data_map.values()])
+        if not self.index.is_trained:
+            self.index.train(vectors)
+        self.index.add_with_ids(vectors, np.array(id_list, dtype=np.int64))
+        # saving rewrites the whole index, so it is done once by flush instead of for every batch
+        self.is_dirty = True
+
+    def flush(self):
+        if self.is_dirty:
+            self.save()
+
+    def rebuild_vector_index(self):
+        # moves an ivfpq index from the flat fallback to a trained index once enough vectors are present
+        self._rebuild_index()
+        self.save()
+
+    def _set_search_params(self, query_limit, ef_search=None, probes=None):
+        index = self.index
+        if isinstance(index, faiss.IndexIDMap2):
+            index = faiss.downcast_index(index.index)
+
+        if isinstance(index, faiss.IndexHNSWFlat):
+            index.hnsw.efSearch = max(ef_search or HNSW_EF_SEARCH, query_limit)
+        elif isinstance(index, faiss.IndexIVFPQ):
+            index.nprobe = probes or FAISS_NPROBE
+
+    def fetch_similar_vector_data(self, query_vector, query_limit, ef_search=None, probes=None):
+        return self.fetch_similar_vector_data_batch([query_vector], query_limit, ef_search, probes)[0]
+
+    def fetch_similar_vector_data_batch(self, query_matrix, query_limit, ef_search=None, probes=None):
+        if not self.index.ntotal:
+            return [[] for _ in range(len(query_matrix))]
+
+        self._set_search_params(query_limit, ef_search, probes)
+        search_limit = min(query_limit + len(self.deleted_id_set), self.index.ntotal)
+        _, id_matrix = self.index.search(self._prepare_vectors(query_matrix), search_limit)
+
+        results = []
+        for id_list in id_matrix:
+            rows = []
+            for id in id_list:
+                if id in self.record_map:
+                    record = self.record_map[id]
+                    rows.append(VectorRecord(record.id, record.function_name, record.short_desc, record.summary, record.code_hash, self._reconstruct(id)))
+                if len(rows) == query_limit:
+                    break
+            results.append(rows)
+        return results
+
+    def fetch_all_data(self):
+        # vectors are not reconstructed here, use fetch_vectors for them
+        return list(self.record_map.values())
+
+    def fetch_vectors(self, function_names):
+        # reconstructed from the index (approximate for ivfpq), functions whose vector can't be reconstructed are left out
+        vector_map = {}
+        for function_name in function_names:
+            id = self.function_id_map.get(function_name, None)
+            vector = self._reconstruct(id) if id is not None else None
+            if vector is not None:
+                vector_map[function_name] = vector
+        return vector_map
+
+    def delete_vector(self, function_name):
+        self.delete_vectors([function_name])
+
+    def delete_vectors(self, function_names):
+        id_list = [self.function_id_map[name] for name in set(function_names) if name in self.function_id_map]
+        if not len(id_list):
+            return
+
+        self._ensure_writable()
+        self._remove_ids(id_list)
+        self.is_dirty = True
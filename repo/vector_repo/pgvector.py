@@ -1,53 +1,216 @@
+import csv
+import io
 from typing import List
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import desc, insert, Integer, String, text, create_engine, select
-from sqlalchemy.orm import Session, declarative_base, mapped_column
+from sqlalchemy import cast, column, desc, insert, Index, Integer, String, text, true, values, create_engine, select
+from sqlalchemy.orm import Session, aliased, declarative_base, mapped_column
 
 from repo.vector_repo.base import VectorDB
-from settings import PG_DB_NAME, PG_HOST, PG_PASSWORD, PG_PORT, PG_USER, VECTOR_EMBEDDING_DIM
+from settings import HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, HNSW_M, IVFFLAT_LISTS, IVFFLAT_PROBES, PG_DB_NAME, PG_HOST, \
+    PG_PASSWORD, PG_PORT, PG_USER, VECTOR_DISTANCE_METRIC, VECTOR_EMBEDDING_DIM, VECTOR_INDEX_TYPE
 
 # TODO: create a separate migration file and use alembic to migrate the database
 Base = declarative_base()
 class MyTable(Base):
     __tablename__ = 'my_table'
+    __table_args__ = (Index('my_table_function_name_idx', 'function_name', unique=True),)
 
     id = mapped_column(Integer, primary_key=True)
     function_name = mapped_column(String)
     short_desc = mapped_column(String)
+    summary = mapped_column(String)
+    code_hash = mapped_column(String)   # hash of the code the summary was generated from
     vector = mapped_column(Vector(VECTOR_EMBEDDING_DIM))
 
     def __repr__(self):
         return f'<MyTable(id={self.id}, function_name={self.function_name}, vector={self.vector})>'
 
+# columns written by the bulk upsert
+UPSERT_COLUMN_LIST = ['function_name', 'short_desc', 'summary', 'code_hash', 'vector']
+COPY_NULL_MARKER = '\\N'
+
+# distance operator and the index opclass supporting it, for every metric
+DISTANCE_METRIC_MAP = {
+    'inner_product': ('max_inner_product', 'vector_ip_ops'),
+    'cosine': ('cosine_distance', 'vector_cosine_ops'),
+    'l2': ('l2_distance', 'vector_l2_ops'),
+}
+VECTOR_INDEX_TYPE_LIST = ['hnsw', 'ivfflat', 'none']
+
 class PgVectorDB(VectorDB):
     def __init__(self):
+        if VECTOR_DISTANCE_METRIC not in DISTANCE_METRIC_MAP:
+            raise ValueError(f"unsupported distance metric: {VECTOR_DISTANCE_METRIC}")
+        if VECTOR_INDEX_TYPE not in VECTOR_INDEX_TYPE_LIST:
+            raise ValueError(f"unsupported vector index type: {VECTOR_INDEX_TYPE}")
+
         # create a database session
         engine = create_engine(f'postgresql://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB_NAME}')
         with engine.connect() as conn:
             conn.execute(text('CREATE EXTENSION IF NOT EXISTS vector'))
             conn.commit()
+        self.engine = engine
         self.session = Session(engine)
 
         # create the table if it doesn't exist
         Base.metadata.create_all(engine)
 
+        # one time migration of the tables created before the unique index (and the columns added along with it),
+        # new tables are created with all of them
+        with engine.connect() as conn:
+            is_migrated = conn.execute(text("SELECT 1 FROM pg_indexes WHERE tablename = 'my_table' \
+                                            AND indexname = 'my_table_function_name_idx'")).first() is not None
+            if not is_migrated:
+                conn.execute(text('ALTER TABLE my_table ADD COLUMN IF NOT EXISTS summary VARCHAR'))
+                conn.execute(text('ALTER TABLE my_table ADD COLUMN IF NOT EXISTS code_hash VARCHAR'))
+
+                # removing the duplicate rows (keeping the latest one) before adding the unique index
+                conn.execute(text('DELETE FROM my_table a USING my_table b WHERE a.function_name = b.function_name AND a.id < b.id'))
+                conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS my_table_function_name_idx ON my_table (function_name)'))
+                conn.commit()
+
+        self.create_vector_index()
+
+    @property
+    def vector_index_name(self):
+        return f'my_table_vector_{VECTOR_INDEX_TYPE}_{VECTOR_DISTANCE_METRIC}_idx'
+
+    def create_vector_index(self):
+        with self.engine.connect() as conn:
+            # dropping the indexes created with a different index type or metric
+            index_list = conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'my_table' AND indexname LIKE 'my_table_vector_%'")).scalars().all()
+            for index_name in index_list:
+                if index_name != self.vector_index_name:
+                    conn.execute(text(f'DROP INDEX IF EXISTS {index_name}'))
+
+            if VECTOR_INDEX_TYPE != 'none':
+                _, opclass = DISTANCE_METRIC_MAP[VECTOR_DISTANCE_METRIC]
+                if VECTOR_INDEX_TYPE == 'hnsw':
+                    index_params = f'm = {int(HNSW_M)}, ef_construction = {int(HNSW_EF_CONSTRUCTION)}'
+                else:
+                    index_params = f'lists = {int(IVFFLAT_LISTS)}'
+
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS {self.vector_index_name} ON my_table \
+                                  USING {VECTOR_INDEX_TYPE} (vector {opclass}) WITH ({index_params})'))
+            conn.commit()
+
+    # hnsw is built once after the bulk load instead of being updated for every inserted row
+    def begin_bulk_load(self):
+        if VECTOR_INDEX_TYPE == 'hnsw':
+            with self.engine.connect() as conn:
+                conn.execute(text(f'DROP INDEX IF EXISTS {self.vector_index_name}'))
+                conn.commit()
+
+    # ivfflat picks its list centers from the rows present while building the index, so it
+    # should be rebuilt once the table is loaded. hnsw (dropped by begin_bulk_load) is created again
+    def rebuild_vector_index(self):
+        if VECTOR_INDEX_TYPE == 'hnsw':
+            self.create_vector_index()
+        elif VECTOR_INDEX_TYPE == 'ivfflat':
+            with self.engine.connect() as conn:
+                conn.execute(text(f'REINDEX INDEX {self.vector_index_name}'))
+                conn.commit()
+
+    def _set_search_params(self, query_limit, ef_search=None, probes=None):
+        # SET LOCAL only applies to the current transaction of the session
+        if VECTOR_INDEX_TYPE == 'hnsw':
+            ef_search = max(ef_search or HNSW_EF_SEARCH, query_limit)
+            self.session.execute(text(f'SET LOCAL hnsw.ef_search = {int(ef_search)}'))
+        elif VECTOR_INDEX_TYPE == 'ivfflat':
+            probes = probes or IVFFLAT_PROBES
+            self.session.execute(text(f'SET LOCAL ivfflat.probes = {int(probes)}'))
+
+    def _distance(self, query_vector):
+        distance_func, _ = DISTANCE_METRIC_MAP[VECTOR_DISTANCE_METRIC]
+        return getattr(MyTable.vector, distance_func)(query_vector)
+
     def add_vector_data(self, data_list: List[dict]):
         self.session.execute(insert(MyTable), data_list)
         self.session.commit()
 
-    def fetch_similar_vector_data(self, query_vector, query_limit):
-        results = self.session.scalars(select(MyTable).order_by(MyTable.vector.max_inner_product(query_vector)).limit(query_limit))
+    def upsert_vector_data(self, data_list: List[dict]):
+        if not len(data_list):
+            return
+
+        # only the last row is kept if a function is present multiple times
+        data_map = {data['function_name']: data for data in data_list}
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for data in data_map.values():
+            row = []
+            for column in UPSERT_COLUMN_LIST:
+                value = data.get(column, None)
+                if value is None:
+                    value = COPY_NULL_MARKER
+                elif column == 'vector':
+                    value = '[' + ','.join(str(float(v)) for v in value) + ']'
+                row.append(value)
+            writer.writerow(row)
+        buffer.seek(0)
+
+        # streaming the rows into a staging table with COPY and merging them into the main table
+        # in a single statement, all inside one transaction
+        column_list = ', '.join(UPSERT_COLUMN_LIST)
+        update_list = ', '.join(f'{column} = EXCLUDED.{column}' for column in UPSERT_COLUMN_LIST if column != 'function_name')
+        cursor = self.session.connection().connection.cursor()
+        try:
+            cursor.execute(f'CREATE TEMP TABLE IF NOT EXISTS my_table_staging (function_name VARCHAR, short_desc VARCHAR, \
+                           summary VARCHAR, code_hash VARCHAR, vector vector({VECTOR_EMBEDDING_DIM})) ON COMMIT DELETE ROWS')
+            cursor.copy_expert(f"COPY my_table_staging ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL_MARKER}')", buffer)
+            cursor.execute(f'INSERT INTO my_table ({column_list}) SELECT {column_list} FROM my_table_staging \
+                           ON CONFLICT (function_name) DO UPDATE SET {update_list}')
+        except Exception:
+            self.session.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        self.session.commit()
+
+    def fetch_similar_vector_data(self, query_vector, query_limit, ef_search=None, probes=None):
+        self._set_search_params(query_limit, ef_search, probes)
+        results = self.session.scalars(select(MyTable).order_by(self._distance(query_vector)).limit(query_limit))
         return results
     
+    def fetch_similar_vector_data_batch(self, query_matrix, query_limit, ef_search=None, probes=None):
+        if not len(query_matrix):
+            return []
+
+        # top rows for every query vector in a single round trip, using a lateral join over the list of queries
+        self._set_search_params(query_limit, ef_search, probes)
+        query_table = values(column('idx', Integer), column('query_vector', String), name='query_table').data(
+            [(idx, '[' + ','.join(str(float(v)) for v in query_vector) + ']') for idx, query_vector in enumerate(query_matrix)])
+        distance = self._distance(cast(query_table.c.query_vector, Vector(VECTOR_EMBEDDING_DIM)))
+        similar_rows = select(MyTable, distance.label('distance')).order_by(distance).limit(query_limit).lateral('similar_rows')
+        similar_row = aliased(MyTable, similar_rows)
+
+        query = select(query_table.c.idx, similar_row).select_from(query_table).join(similar_rows, true()) \
+            .order_by(query_table.c.idx, similar_rows.c.distance)
+
+        results = [[] for _ in range(len(query_matrix))]
+        for idx, row in self.session.execute(query):
+            results[idx].append(row)
+        return results
+
     def fetch_all_data(self):
         results = self.session.query(MyTable).all()
         return results
     
     def delete_vector(self, function_name):
-        record_to_delete = self.session.scalars(select(MyTable).filter(MyTable.function_name == function_name)).first()
-        if record_to_delete:
-             self.session.delete(record_to_delete)
-             self.session.commit()
+        self.delete_vectors([function_name])
+
+    def delete_vectors(self, function_names):
+        # a single statement (and transaction) for all the functions
+        if not len(function_names):
+            return
+
+        try:
+            self.session.execute(text('DELETE FROM my_table WHERE function_name = ANY(:function_names)'), {"function_names": list(function_names)})
+        except Exception:
+            self.session.rollback()
+            raise
+        self.session.commit()
 
     def get_last_id(self):
         last_entry = self.session.query(MyTable).order_by(desc(MyTable.id)).first()
@@ -17,3 +17,97 @@ VECTOR_EMBEDDING_DIM = 1536
 
 MAX_TREE_DEPTH = 3
 FORCE_SUB_TASK_CREATION = True  # create sub tasks even for straightforward questions
+
+# local cache for the workspace index and other intermediate data
+CACHE_DIR = os.getenv("HAL_CACHE_DIR", ".hal_cache")
+SYMBOL_INDEX_PATH = os.path.join(CACHE_DIR, "symbol_index.json")
+
+# number of function summaries generated in parallel
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", 8))
+# number of processes used for parsing the workspace files, defaults to the number of cpus
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", 0)) or None
+
+# limits for a single embedding request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 2048))
+EMBEDDING_BATCH_TOKEN_LIMIT = int(os.getenv("EMBEDDING_BATCH_TOKEN_LIMIT", 100000))
+
+# indexing pipeline config, the summaries are embedded in micro batches (sent after INDEXING_FLUSH_INTERVAL
+# seconds even if not full) and written to the vector db in batches of INDEXING_DB_BATCH_SIZE
+INDEXING_QUEUE_SIZE = int(os.getenv("INDEXING_QUEUE_SIZE", 256))
+INDEXING_SHORT_DESC_WORKERS = int(os.getenv("INDEXING_SHORT_DESC_WORKERS", 8))
+INDEXING_EMBEDDING_BATCH_SIZE = int(os.getenv("INDEXING_EMBEDDING_BATCH_SIZE", 64))
+INDEXING_DB_BATCH_SIZE = int(os.getenv("INDEXING_DB_BATCH_SIZE", 500))
+INDEXING_FLUSH_INTERVAL = float(os.getenv("INDEXING_FLUSH_INTERVAL", 0.5))
+# state of the symbols of the current indexing run, used to resume a failed run (app.py --resume)
+INDEXING_CHECKPOINT_PATH = os.path.join(CACHE_DIR, "indexing_checkpoint.sqlite")
+INDEXING_CHECKPOINT_BATCH_SIZE = int(os.getenv("INDEXING_CHECKPOINT_BATCH_SIZE", 50))
+
+# vector index config, the index is built for the chosen distance metric
+VECTOR_DISTANCE_METRIC = os.getenv("VECTOR_DISTANCE_METRIC", "inner_product")   # inner_product, cosine or l2
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")    # hnsw, ivfflat or none
+HNSW_M = int(os.getenv("HNSW_M", 16))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", 64))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 40))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", 100))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", 10))
+
+# vector store used for the function descriptions - pgvector or faiss
+VECTOR_DB = os.getenv("VECTOR_DB", "pgvector")
+
+# faiss config, the index is stored in the local cache
+FAISS_INDEX_DIR = os.path.join(CACHE_DIR, "faiss")
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")  # flat, hnsw or ivfpq
+FAISS_IVF_LISTS = int(os.getenv("FAISS_IVF_LISTS", 100))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 10))
+FAISS_PQ_SUBQUANTIZERS = int(os.getenv("FAISS_PQ_SUBQUANTIZERS", 64))  # should divide VECTOR_EMBEDDING_DIM
+FAISS_USE_MMAP = os.getenv("FAISS_USE_MMAP", "true").lower() == "true"
+
+# cache of the LLM responses, set LLM_CACHE_BYPASS to always query the API
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_cache.sqlite")
+LLM_CACHE_MAX_SIZE = int(os.getenv("LLM_CACHE_MAX_SIZE_MB", 512)) * 1024 * 1024
+LLM_CACHE_MAX_AGE = int(os.getenv("LLM_CACHE_MAX_AGE_DAYS", 30)) * 24 * 60 * 60
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "false").lower() == "true"
+
+# cache of the text embeddings, stored as float32 vectors (also skipped with LLM_CACHE_BYPASS)
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embedding_cache")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+
+# async OpenAI client config, the limits should match the rate limits of the account
+OPENAI_USE_ASYNC_CLIENT = os.getenv("OPENAI_USE_ASYNC_CLIENT", "true").lower() == "true"
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 16))
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 3500))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", 90000))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 5))
+OPENAI_REQUEST_TIMEOUT = int(os.getenv("OPENAI_REQUEST_TIMEOUT", 60))
+
+# number of tasks expanded/solved in parallel by the solver
+SOLVER_CONCURRENCY = int(os.getenv("SOLVER_CONCURRENCY", 8))
+
+# tokens kept free in a prompt for the response of the model
+PROMPT_RESPONSE_TOKEN_RESERVE = int(os.getenv("PROMPT_RESPONSE_TOKEN_RESERVE", 512))
+
+# least tokens given to the function descriptions of a prompt, used when the task list leaves less than this
+# in the context window (the prompt may then be cut by the model)
+MIN_FUNCTION_DESC_TOKEN_BUDGET = int(os.getenv("MIN_FUNCTION_DESC_TOKEN_BUDGET", 256))
+
+# tokens of code sent in a single summary/code generation prompt, the retrieved functions are sent
+# in full while they fit and as skeletons (signature and docstring) after that
+CODE_CONTEXT_TOKEN_BUDGET = int(os.getenv("CODE_CONTEXT_TOKEN_BUDGET", 2000))
+
+# number of functions (closest to the task list) checked by the LLM for every task,
+# set CANDIDATE_MMR_LAMBDA (0 to 1, lower is more diverse) to re-rank them using MMR. the re-ranking needs the
+# embeddings of the tasks, so it is skipped in the lexical retrieval mode
+CANDIDATE_FUNCTION_LIMIT = int(os.getenv("CANDIDATE_FUNCTION_LIMIT", 50))
+CANDIDATE_MMR_LAMBDA = float(os.getenv("CANDIDATE_MMR_LAMBDA")) if os.getenv("CANDIDATE_MMR_LAMBDA") else None
+
+# functions are retrieved by their summary embeddings (vector), a BM25 index over their names, signatures,
+# docstrings and short descriptions (lexical, no embedding call) or both fused by reciprocal rank (hybrid)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+LEXICAL_INDEX_PATH = os.path.join(CACHE_DIR, "lexical_index.npz")
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# per stage timings, token usage and cost of a run are written to this report (.json or .csv),
+# INSTRUMENTATION_LIVE prints a running summary line
+INSTRUMENTATION_REPORT_PATH = os.getenv("INSTRUMENTATION_REPORT_PATH", os.path.join(CACHE_DIR, "pipeline_report.json"))
+INSTRUMENTATION_LIVE = os.getenv("INSTRUMENTATION_LIVE", "false").lower() == "true"
@@ -4,8 +4,20 @@ import random
 from typing import List
 import re
 
-from settings import FORCE_SUB_TASK_CREATION, OPENAI_API_KEY, VECTOR_EMBEDDING_DIM
+import numpy as np
+
+from settings import EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_TOKEN_LIMIT, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, \
+    FORCE_SUB_TASK_CREATION, LLM_CACHE_BYPASS, LLM_CACHE_MAX_AGE, LLM_CACHE_MAX_SIZE, LLM_CACHE_PATH, OPENAI_API_KEY, \
+    OPENAI_USE_ASYNC_CLIENT, PROMPT_RESPONSE_TOKEN_RESERVE, VECTOR_EMBEDDING_DIM
+from utils.ai_agent.cache import LLMResponseCache
+from utils.ai_agent.embedding_cache import EmbeddingCache
 from utils.ai_agent.constants import OpenAIModel
+from utils.instrumentation import instrumentation
+from utils.tokenizer import count_message_tokens, count_tokens, truncate_text
+
+
+class AIAgentError(Exception):
+    pass
 
 
 class AIAgent(ABC):
@@ -33,6 +45,10 @@ class AIAgent(ABC):
     def get_text_embedding(self, text):
         pass
 
+    # returns a (len(texts) x VECTOR_EMBEDDING_DIM) float32 array
+    def get_text_embeddings(self, texts: List[str]) -> np.ndarray:
+        pass
+
     def get_task_breakup(self, query, func_desc_map):
         pass
 
@@ -48,6 +64,10 @@ class AIAgent(ABC):
     def update_task_list_based_on_function_desc(self, task_list, function_desc_map):
         pass
 
+    # number of tokens of function descriptions which can be sent in a single update_task_list_based_on_function_desc call
+    def get_function_desc_token_budget(self, task_list):
+        pass
+
     def regenerate_task_list(self, combined_task_list, combined_instructions):
         pass
 
@@ -62,8 +82,12 @@ class OpenAI(AIAgent):
         self.openai = openai
         openai.api_key = OPENAI_API_KEY
         self.ai_model = OpenAIModel.gpt_turbo
+        self.embedding_model = OpenAIModel.ada_embedding
         self.temperature = 0
         self.print_queries = True
+        self.response_cache = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_SIZE, LLM_CACHE_MAX_AGE)
+        self.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, VECTOR_EMBEDDING_DIM, EMBEDDING_CACHE_MAX_ENTRIES)
+        self.bypass_cache = LLM_CACHE_BYPASS
         self._set_prompts()
     
     def _set_prompts(self):
@@ -100,22 +124,45 @@ class OpenAI(AIAgent):
             print(context)
 
         start_time = time.time()
+
+        # only deterministic responses are cached
+        use_cache = not self.bypass_cache and self.temperature == 0
+        if use_cache:
+            cache_key = LLMResponseCache.get_key(data["model"], data["temperature"], data["messages"])
+            res = self.response_cache.get(cache_key)
+            if res:
+                instrumentation.record_call(data["model"], cached=True)
+                res["time_taken"] = round((time.time() - start_time) * 1000, 6)
+                res["cached"] = True
+                return res
+
         try:
-            response = self.openai.ChatCompletion.create(**data)
+            response = self._create_chat_completion(data)
         except Exception as e:
             print("error occured: ", str(e))
-            return None
+            raise AIAgentError(str(e)) from e
 
         end_time = time.time()
 
         time_taken = round((end_time - start_time) * 1000, 6)   # in ms
+        usage = response["usage"]
+        instrumentation.record_call(data["model"], usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
 
-        return {
+        res = {
             "token_usage": response["usage"]["total_tokens"],
-            "time_taken": time_taken,
             "output": response["choices"][0]["message"]["content"] 
         }
+        if use_cache:
+            self.response_cache.set(cache_key, res)
+
+        return dict(res, time_taken=time_taken, cached=False)
     
+    def _create_chat_completion(self, data):
+        return self.openai.ChatCompletion.create(**data)
+
+    def _create_embeddings(self, text_list):
+        return self.openai.Embedding.create(input=text_list, model=self.embedding_model.model)
+
     def is_breakdown_of_task_needed(self, task: str):
         if FORCE_SUB_TASK_CREATION:
             return True
@@ -186,9 +233,57 @@ class OpenAI(AIAgent):
         return res['output']
     
     def get_text_embedding(self, text):
-        text = text.replace("\n", " ")
-        model="text-embedding-ada-002"
-        return self.openai.Embedding.create(input = [text], model=model)['data'][0]['embedding']
+        return self.get_text_embeddings([text])[0]
+
+    def _get_embedding_batches(self, texts):
+        # grouping the texts so that every request stays within the token budget
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = count_tokens(text, self.embedding_model.model)
+            if len(batch) and (batch_tokens + tokens > EMBEDDING_BATCH_TOKEN_LIMIT or len(batch) >= EMBEDDING_BATCH_SIZE):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+
+        if len(batch):
+            yield batch
+
+    def get_text_embeddings(self, texts):
+        embeddings = np.empty((len(texts), VECTOR_EMBEDDING_DIM), dtype=np.float32)
+        texts = [EmbeddingCache.normalize_text(text) for text in texts]
+
+        cached_embeddings = {} if self.bypass_cache else self.embedding_cache.get_many(self.embedding_model.model, texts)
+        for idx, embedding in cached_embeddings.items():
+            embeddings[idx] = embedding
+        if len(cached_embeddings):
+            instrumentation.record_call(self.embedding_model.model, cached=True, call_count=len(cached_embeddings))
+
+        # fetching every missing text only once
+        missing_text_map = {}
+        for idx, text in enumerate(texts):
+            if idx not in cached_embeddings:
+                missing_text_map.setdefault(text, []).append(idx)
+
+        missing_text_list = list(missing_text_map.keys())
+        request_text_list = [truncate_text(text, self.embedding_model.max_tokens, self.embedding_model.model) for text in missing_text_list]
+        missing_embeddings = np.empty((len(missing_text_list), VECTOR_EMBEDDING_DIM), dtype=np.float32)
+        idx = 0
+        for batch in self._get_embedding_batches(request_text_list):
+            response = self._create_embeddings(batch)
+            instrumentation.record_call(self.embedding_model.model, response.get("usage", {}).get("prompt_tokens", 0))
+            # the response is not guaranteed to be in the same order as the input
+            for row in response['data']:
+                missing_embeddings[idx + row['index']] = row['embedding']
+            idx += len(batch)
+
+        for text, embedding in zip(missing_text_list, missing_embeddings):
+            embeddings[missing_text_map[text]] = embedding
+
+        if len(missing_text_list):
+            self.embedding_cache.set_many(self.embedding_model.model, missing_text_list, missing_embeddings)
+
+        return embeddings
     
     def get_task_breakup(self, query, func_desc_map):
         func_desc_query = ''
@@ -274,10 +369,7 @@ class OpenAI(AIAgent):
     
     # given a set of steps and set of functions already present in the code
     # this function determines how to achieve them
-    def update_task_list_based_on_function_desc(self, task_list, func_desc_map):
-        if not len(func_desc_map.keys()):
-            return task_list
-        
+    def _get_function_desc_prompt(self, task_list, func_desc_map):
         func_desc_query = 'these functions are present in the code: \n'
         for k, v in func_desc_map.items():
             func_desc_query += f"{k} - {v}\n"
@@ -303,11 +395,27 @@ class OpenAI(AIAgent):
                 {base_query} take two numbers as input. form a complex number using these, first number will be real part, second will be imaginary part. then print that complex number"},
             {"role": "assistant", "content": "print_complex_num: this can be used to print a complex number"},
         ]
+        return func_desc_query, context
+
+    def update_task_list_based_on_function_desc(self, task_list, func_desc_map):
+        if not len(func_desc_map.keys()):
+            return task_list
 
+        func_desc_query, context = self._get_function_desc_prompt(task_list, func_desc_map)
         res_task = self.get_query(func_desc_query, context)
         res_task = res_task['output'].split('\n')
         return res_task
     
+    def get_function_desc_token_budget(self, task_list):
+        # tokens left for the function descriptions after the few-shot context, the task list and the response
+        func_desc_query, context = self._get_function_desc_prompt(task_list, {})
+        messages = context + [{"role": "user", "content": func_desc_query}]
+        for message in messages:
+            message["content"] = re.sub(' +', ' ', message["content"])
+
+        prompt_tokens = count_message_tokens(messages, self.ai_model.model)
+        return self.ai_model.context_window - prompt_tokens - PROMPT_RESPONSE_TOKEN_RESERVE
+
     def regenerate_task_list(self, combined_task_list, combined_instructions):
         base_query = '\n\nusing the functions provides in this prompt create a new task list. For example if there are \
             10 steps, but they can be solved by a single function "xyz" then return a single step mentioning \
@@ -361,7 +469,10 @@ class TestAIAgent(AIAgent):
         return "does some random class stuff"
     
     def get_text_embedding(self, text):
-        return [1] * VECTOR_EMBEDDING_DIM
+        return self.get_text_embeddings([text])[0]
+
+    def get_text_embeddings(self, texts):
+        return np.ones((len(texts), VECTOR_EMBEDDING_DIM), dtype=np.float32)
     
     def get_task_breakup(self, query, func_desc_map):
         return ['code', 'code some more']
@@ -377,6 +488,9 @@ class TestAIAgent(AIAgent):
     
     def update_task_list_based_on_function_desc(self, task_list, func_desc_map):
         return task_list
+
+    def get_function_desc_token_budget(self, task_list):
+        return OpenAIModel.gpt_turbo.context_window - PROMPT_RESPONSE_TOKEN_RESERVE
     
     def regenerate_task_list(self, combined_task_list, combined_instructions):
         return combined_task_list.split('\n')
@@ -387,5 +501,8 @@ class TestAIAgent(AIAgent):
 def get_ai_agent(debug=False) -> AIAgent:
     if debug:
         return TestAIAgent()
+    elif OPENAI_USE_ASYNC_CLIENT:
+        from utils.ai_agent.async_openai import AsyncOpenAI
+        return AsyncOpenAI()
     else:
         return OpenAI()
\ No newline at end of file
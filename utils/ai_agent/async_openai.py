@@ -0,0 +1,99 @@
+import asyncio
+import random
+import threading
+
+import httpx
+
+from settings import OPENAI_API_BASE, OPENAI_API_KEY, OPENAI_MAX_CONCURRENCY, OPENAI_MAX_RETRIES, OPENAI_REQUEST_TIMEOUT, \
+    OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE
+from utils.ai_agent.ai_agent import AIAgentError, OpenAI
+from utils.ai_agent.rate_limiter import RateLimiter
+from utils.tokenizer import count_tokens
+
+# backoff between the retries (in seconds)
+BASE_RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+
+
+class AsyncOpenAI(OpenAI):
+    '''
+    OpenAI agent which sends the requests through a pooled async http client. all the requests
+    (from any thread) run on a single background event loop, limited by the number of concurrent
+    requests and the requests/tokens per minute. 429 and 5xx responses are retried with a jittered
+    exponential backoff. the sync methods of the agent wait for the result of the async request.
+    a custom httpx transport can be passed for testing without the network
+    '''
+    def __init__(self, transport: httpx.AsyncBaseTransport = None):
+        super().__init__()
+        self.rate_limiter = RateLimiter(OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE)
+        self.semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+        self.client = httpx.AsyncClient(
+            base_url=OPENAI_API_BASE,
+            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+            timeout=OPENAI_REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=OPENAI_MAX_CONCURRENCY, max_keepalive_connections=OPENAI_MAX_CONCURRENCY),
+            transport=transport
+        )
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        self._run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+
+    def _get_retry_delay(self, attempt, response=None):
+        if response is not None and response.headers.get("retry-after"):
+            try:
+                return float(response.headers["retry-after"])
+            except ValueError:
+                pass
+
+        # full jitter
+        return random.uniform(0, min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** attempt))
+
+    async def _post(self, path, payload, token_count):
+        async with self.semaphore:
+            error = None
+            for attempt in range(OPENAI_MAX_RETRIES + 1):
+                if attempt:
+                    await asyncio.sleep(self._get_retry_delay(attempt - 1, response))
+
+                await self.rate_limiter.acquire(token_count)
+                response = None
+                try:
+                    response = await self.client.post(path, json=payload)
+                except httpx.TransportError as e:
+                    error = e
+                    continue
+
+                if response.status_code == 200:
+                    res = response.json()
+                    if "usage" in res:
+                        self.rate_limiter.record_usage(token_count, res["usage"]["total_tokens"])
+                    return res
+
+                error = AIAgentError(f"request to {path} failed with status {response.status_code}: {response.text}")
+                if response.status_code != 429 and response.status_code < 500:
+                    raise error
+
+            raise AIAgentError(f"request to {path} failed after {OPENAI_MAX_RETRIES + 1} attempts: {str(error)}")
+
+    async def acreate_chat_completion(self, data):
+        token_count = sum(count_tokens(message["content"], self.ai_model.model) for message in data["messages"])
+        return await self._post("/chat/completions", data, token_count)
+
+    async def acreate_embeddings(self, text_list):
+        token_count = sum(count_tokens(text, self.embedding_model.model) for text in text_list)
+        return await self._post("/embeddings", {"input": text_list, "model": self.embedding_model.model}, token_count)
+
+    def _create_chat_completion(self, data):
+        return self._run(self.acreate_chat_completion(data))
+
+    def _create_embeddings(self, text_list):
+        return self._run(self.acreate_embeddings(text_list))
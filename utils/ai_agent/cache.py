@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class LLMResponseCache:
+    '''
+    persistent cache of the LLM responses, keyed by the hash of the request (model, temperature and messages).
+    entries older than max_age are dropped and the least recently used entries are evicted once the
+    cache grows beyond max_size
+    '''
+    def __init__(self, path, max_size_bytes, max_age_seconds):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        # the agent can be called from multiple threads
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT, size INTEGER, \
+                          created_at REAL, accessed_at REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS llm_cache_accessed_at_idx ON llm_cache (accessed_at)')
+        self.conn.commit()
+        self.total_size = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM llm_cache').fetchone()[0]
+
+    @staticmethod
+    def get_key(model, temperature, messages):
+        data = json.dumps([model, temperature, messages], sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute('SELECT response, size, created_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            if row and now - row[2] > self.max_age_seconds:
+                self._delete([key], row[1])
+                row = None
+
+            if not row:
+                self.misses += 1
+                return None
+
+            self.conn.execute('UPDATE llm_cache SET accessed_at = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, response):
+        now = time.time()
+        data = json.dumps(response)
+        with self.lock:
+            row = self.conn.execute('SELECT size FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            self.conn.execute('INSERT OR REPLACE INTO llm_cache (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)', \
+                              (key, data, len(data), now, now))
+            self.total_size += len(data) - (row[0] if row else 0)
+            self.conn.commit()
+
+            if self.total_size > self.max_size_bytes:
+                self._evict(now)
+
+    def _delete(self, key_list, size):
+        self.conn.executemany('DELETE FROM llm_cache WHERE key = ?', [(key,) for key in key_list])
+        self.conn.commit()
+        self.total_size -= size
+
+    def _evict(self, now):
+        # dropping the expired entries first and then the least recently used ones
+        rows = self.conn.execute('SELECT key, size FROM llm_cache WHERE created_at < ?', (now - self.max_age_seconds,)).fetchall()
+        self._delete([key for key, _ in rows], sum(size for _, size in rows))
+
+        key_list, freed_size = [], 0
+        if self.total_size > self.max_size_bytes:
+            for key, size in self.conn.execute('SELECT key, size FROM llm_cache ORDER BY accessed_at'):
+                if self.total_size - freed_size <= self.max_size_bytes:
+                    break
+                key_list.append(key)
+                freed_size += size
+        self._delete(key_list, freed_size)
+
+    def get_stats(self):
+        with self.lock:
+            entry_count = self.conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entry_count,
+            "size_bytes": self.total_size
+        }
@@ -4,7 +4,19 @@ from dataclasses import dataclass
 class BaseModel:
     model: str
     max_tokens: int
+    context_window: int
+    input_cost: float = 0   # USD per 1k tokens
+    output_cost: float = 0
 
 @dataclass
 class OpenAIModel:
-    gpt_turbo = BaseModel("gpt-3.5-turbo", 2000)
\ No newline at end of file
+    gpt_turbo = BaseModel("gpt-3.5-turbo", 2000, 4096, 0.0015, 0.002)
+    ada_embedding = BaseModel("text-embedding-ada-002", 8191, 8191, 0.0001, 0)
+
+
+def get_model_cost(model_name, tokens_in, tokens_out):
+    # estimated cost (in USD) of a request, 0 for unknown models
+    for model in (OpenAIModel.gpt_turbo, OpenAIModel.ada_embedding):
+        if model.model == model_name:
+            return (tokens_in * model.input_cost + tokens_out * model.output_cost) / 1000
+    return 0
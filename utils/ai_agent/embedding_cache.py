@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+# number of vectors the data file is created with, it is doubled whenever it is full
+INITIAL_CAPACITY = 1024
+# the cache is trimmed to this fraction of max_entries once it goes beyond it, so that the entries
+# aren't sorted by their access time on every insert at capacity
+EVICTION_LOW_WATER_FRACTION = 0.9
+
+
+class EmbeddingCache:
+    '''
+    persistent cache of text embeddings, keyed by the model and the hash of the normalized text.
+    vectors are stored as packed float32 rows in a memory mapped file and an sqlite table maps
+    every key to its row (slot). least recently used entries are evicted (in bulk) beyond max_entries
+    '''
+    def __init__(self, cache_dir, dim, max_entries):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS embedding_index (key TEXT PRIMARY KEY, slot INTEGER, accessed_at REAL)')
+        self.conn.commit()
+
+        self.slot_map = {}      # key -> slot
+        self.accessed_at_map = {}
+        for key, slot, accessed_at in self.conn.execute('SELECT key, slot, accessed_at FROM embedding_index'):
+            self.slot_map[key] = slot
+            self.accessed_at_map[key] = accessed_at
+
+        self.vector_path = os.path.join(cache_dir, 'vectors.f32')
+        row_size = self.dim * np.dtype(np.float32).itemsize
+        file_size = os.path.getsize(self.vector_path) if os.path.exists(self.vector_path) else 0
+        self.capacity = max(file_size // row_size, INITIAL_CAPACITY, max(self.slot_map.values(), default=-1) + 1)
+        self._open_vectors()
+
+        used_slot_set = set(self.slot_map.values())
+        self.free_slot_list = [slot for slot in range(self.capacity - 1, -1, -1) if slot not in used_slot_set]
+
+    def _open_vectors(self):
+        row_size = self.dim * np.dtype(np.float32).itemsize
+        with open(self.vector_path, 'ab') as f:
+            if f.tell() < self.capacity * row_size:
+                f.truncate(self.capacity * row_size)
+        self.vectors = np.memmap(self.vector_path, dtype=np.float32, mode='r+', shape=(self.capacity, self.dim))
+
+    def _grow(self):
+        self.vectors.flush()
+        del self.vectors
+        old_capacity = self.capacity
+        self.capacity *= 2
+        self._open_vectors()
+        self.free_slot_list = list(range(self.capacity - 1, old_capacity - 1, -1)) + self.free_slot_list
+
+    @staticmethod
+    def normalize_text(text):
+        return ' '.join(text.split())
+
+    @staticmethod
+    def get_key(model, text):
+        data = model + '\0' + EmbeddingCache.normalize_text(text)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get_many(self, model, text_list):
+        '''
+        returns a map of the index (in text_list) to the vector, for every text present in the cache
+        '''
+        now = time.time()
+        results = {}
+        with self.lock:
+            key_list = []
+            for idx, text in enumerate(text_list):
+                key = self.get_key(model, text)
+                if key in self.slot_map:
+                    results[idx] = np.array(self.vectors[self.slot_map[key]])
+                    self.accessed_at_map[key] = now
+                    key_list.append(key)
+
+            if len(key_list):
+                self.conn.executemany('UPDATE embedding_index SET accessed_at = ? WHERE key = ?', [(now, key) for key in key_list])
+                self.conn.commit()
+
+            self.hits += len(results)
+            self.misses += len(text_list) - len(results)
+        return results
+
+    def set_many(self, model, text_list, vectors):
+        now = time.time()
+        with self.lock:
+            row_list = []
+            for text, vector in zip(text_list, vectors):
+                key = self.get_key(model, text)
+                if key not in self.slot_map:
+                    if not len(self.free_slot_list):
+                        self._grow()
+                    self.slot_map[key] = self.free_slot_list.pop()
+
+                self.vectors[self.slot_map[key]] = vector
+                self.accessed_at_map[key] = now
+                row_list.append((key, self.slot_map[key], now))
+
+            # vectors are written before the index so that the index never points to a missing vector
+            self.vectors.flush()
+            self.conn.executemany('INSERT OR REPLACE INTO embedding_index (key, slot, accessed_at) VALUES (?, ?, ?)', row_list)
+            self.conn.commit()
+
+            if len(self.slot_map) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        evicted_count = len(self.slot_map) - int(self.max_entries * EVICTION_LOW_WATER_FRACTION)
+        evicted_key_list = sorted(self.accessed_at_map.keys(), key=lambda key: self.accessed_at_map[key])[:evicted_count]
+        for key in evicted_key_list:
+            self.free_slot_list.append(self.slot_map.pop(key))
+            self.accessed_at_map.pop(key)
+
+        self.conn.executemany('DELETE FROM embedding_index WHERE key = ?', [(key,) for key in evicted_key_list])
+        self.conn.commit()
+
+    def get_stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.slot_map),
+            "size_bytes": self.capacity * self.dim * np.dtype(np.float32).itemsize
+        }
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, capacity_per_minute):
+        self.capacity = capacity_per_minute
+        self.rate = capacity_per_minute / 60     # refilled per second
+        self.tokens = capacity_per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def get_wait_time(self, amount):
+        # requests larger than the bucket are allowed once the bucket is full
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        # the balance can go negative when the actual usage is more than the estimate
+        self._refill()
+        self.tokens -= amount
+
+
+class RateLimiter:
+    '''
+    limits the requests per minute and the tokens per minute sent to the API, callers wait
+    (in the order they arrived) until both the buckets have enough capacity
+    '''
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, token_count):
+        async with self.lock:
+            while True:
+                wait_time = max(self.request_bucket.get_wait_time(1), self.token_bucket.get_wait_time(token_count))
+                if wait_time <= 0:
+                    break
+                await asyncio.sleep(wait_time)
+
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(token_count)
+
+    def record_usage(self, estimated_token_count, actual_token_count):
+        # correcting the token bucket once the actual usage is known
+        self.token_bucket.consume(actual_token_count - estimated_token_count)
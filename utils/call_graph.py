@@ -0,0 +1,177 @@
+from array import array
+from typing import Dict, List
+
+from utils.symbol_index import split_symbol_name
+
+
+def _build_adjacency(node_count, edge_list):
+    '''
+    compressed adjacency (CSR) of the edges, the neighbours of node i are
+    edges[offsets[i]:offsets[i + 1]]
+    '''
+    offsets = array('i', [0]) * (node_count + 1)
+    for src, _ in edge_list:
+        offsets[src + 1] += 1
+    for i in range(node_count):
+        offsets[i + 1] += offsets[i]
+
+    edges = array('i', (dst for _, dst in sorted(edge_list)))
+    return offsets, edges
+
+
+class CallGraph:
+    '''
+    function call graph over module qualified names. every name is given an integer id and the
+    forward (callees) and reverse (callers) edges are stored as compact int arrays
+    '''
+    def __init__(self, name_list: List[str], edge_list, class_method_map=None):
+        self.names = list(name_list)
+        self.class_method_map: Dict[str, List[str]] = class_method_map or {}    # class -> its methods present in the graph
+        self.ids: Dict[str, int] = {name: idx for idx, name in enumerate(self.names)}
+        for caller, callee in edge_list:
+            for name in (caller, callee):
+                if name not in self.ids:
+                    self.ids[name] = len(self.names)
+                    self.names.append(name)
+
+        id_edge_list = set((self.ids[caller], self.ids[callee]) for caller, callee in edge_list if caller != callee)
+        self.forward_offsets, self.forward_edges = _build_adjacency(len(self.names), id_edge_list)
+        self.reverse_offsets, self.reverse_edges = _build_adjacency(len(self.names), [(dst, src) for src, dst in id_edge_list])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    @property
+    def edge_count(self):
+        return len(self.forward_edges)
+
+    def get_callees(self, name):
+        idx = self.ids[name]
+        return [self.names[i] for i in self.forward_edges[self.forward_offsets[idx]:self.forward_offsets[idx + 1]]]
+
+    def get_callers(self, name):
+        idx = self.ids[name]
+        return [self.names[i] for i in self.reverse_edges[self.reverse_offsets[idx]:self.reverse_offsets[idx + 1]]]
+
+    def get_class_methods(self, class_name):
+        return self.class_method_map.get(class_name, [])
+
+    def get_transitive_callers(self, name_list):
+        '''
+        all the functions which directly or indirectly call any of the given functions,
+        names which are not part of the graph are ignored
+        '''
+        visited = bytearray(len(self.names))
+        pending = [self.ids[name] for name in name_list if name in self.ids]
+        callers = set()
+        while len(pending):
+            idx = pending.pop()
+            for caller_idx in self.reverse_edges[self.reverse_offsets[idx]:self.reverse_offsets[idx + 1]]:
+                if not visited[caller_idx]:
+                    visited[caller_idx] = 1
+                    callers.add(self.names[caller_idx])
+                    pending.append(caller_idx)
+
+        return callers
+
+    def to_tree(self) -> Dict[str, List[str]]:
+        # function -> sorted list of the functions called by it
+        return {name: sorted(self.get_callees(name)) for name in self.names}
+
+
+class CallResolver:
+    '''
+    resolves the names called inside a module (e.g. 'self.fetch', 'np.zeros', 'SymbolIndex')
+    to the module qualified symbols of the workspace, using the imports of the module
+    '''
+    def __init__(self, module_data_map):
+        self.module_data_map = module_data_map
+        self.symbol_kind_map = {}
+        for data in module_data_map.values():
+            for name, kind, *_ in data["symbols"]:
+                self.symbol_kind_map[name] = kind
+
+    def resolve(self, module_name, called_name, class_qualname=None):
+        head, *rest = called_name.split('.')
+        if head in ('self', 'cls'):
+            if class_qualname and len(rest) == 1:
+                return self._find_method(module_name + ':' + class_qualname, rest[0], set())
+            return None
+
+        # names defined in the module shadow the imported ones
+        if module_name + ':' + head in self.symbol_kind_map:
+            return self._lookup(module_name + ':' + head, rest)
+
+        target = self.module_data_map[module_name]["imports"].get(head, None) if module_name in self.module_data_map else None
+        return self._lookup(target, rest) if target else None
+
+    def _lookup(self, target, rest):
+        if ':' in target:
+            name = target + ''.join('.' + part for part in rest)
+            if name in self.symbol_kind_map:
+                return name
+            if target in self.symbol_kind_map:
+                if self.symbol_kind_map[target] == 'class' and len(rest) == 1:
+                    return self._find_method(target, rest[0], set())
+                return None
+            # 'from pkg import module' imports a module and not a symbol
+            target = target.replace(':', '.')
+
+        # the module part of a.b.c.func is not known, trying every split
+        for i in range(len(rest)):
+            name = '.'.join([target] + rest[:i]) + ':' + '.'.join(rest[i:])
+            if name in self.symbol_kind_map:
+                return name
+        return None
+
+    def _find_method(self, class_name, method_name, visited):
+        # looking up the method in the class and then its bases (depth first)
+        name = class_name + '.' + method_name
+        if name in self.symbol_kind_map:
+            return name
+
+        visited.add(class_name)
+        module_name, class_qualname = split_symbol_name(class_name)
+        for base in self.module_data_map.get(module_name, {}).get("class_bases", {}).get(class_qualname, []):
+            base_name = self.resolve(module_name, base)
+            if base_name and base_name not in visited and self.symbol_kind_map.get(base_name) == 'class':
+                name = self._find_method(base_name, method_name, visited)
+                if name:
+                    return name
+        return None
+
+
+def build_call_graph(module_data_map, excluded_functions=frozenset()) -> CallGraph:
+    '''
+    call graph of all the functions and methods present in the given modules (module name -> parsed data).
+    methods of test classes and the excluded functions are left out, classes are only added when
+    they are called (initialized) by some function. the methods of every class are indexed along the way
+    '''
+    resolver = CallResolver(module_data_map)
+
+    name_list, edge_list, class_method_map = [], [], {}
+    for module_name, data in module_data_map.items():
+        for qualname in data["calls"].keys():
+            *class_scope, func_name = qualname.split('.')
+            if func_name in excluded_functions or any(c.startswith("Test") for c in class_scope):
+                continue
+            name_list.append(module_name + ':' + qualname)
+            if len(class_scope):
+                class_method_map.setdefault(module_name + ':' + '.'.join(class_scope), []).append(name_list[-1])
+
+    node_set = set(name_list)
+    for name in name_list:
+        module_name, qualname = split_symbol_name(name)
+        class_qualname = qualname.rpartition('.')[0] or None
+        for called_name in module_data_map[module_name]["calls"][qualname]:
+            callee = resolver.resolve(module_name, called_name, class_qualname)
+            if callee in node_set:
+                edge_list.append((name, callee))
+            elif callee and resolver.symbol_kind_map[callee] == 'class' and not split_symbol_name(callee)[1].startswith("Test"):
+                edge_list.append((name, callee))
+                class_method_map.setdefault(callee, [])
+
+    return CallGraph(name_list, edge_list, class_method_map)
@@ -0,0 +1,37 @@
+from utils.ai_agent.constants import OpenAIModel
+from utils.codemap import CodeWorkspaceClient
+from utils.tokenizer import count_tokens, truncate_text
+
+
+def get_code_context(workspace_client: CodeWorkspaceClient, name_list, token_budget, callee_map=None, model_name=OpenAIModel.gpt_turbo.model):
+    '''
+    code of the given functions (in the order of their relevance) fitting in the token budget of a prompt.
+    a function gets its full code while the budget allows and only its skeleton (signature and docstring)
+    after that, the callees of the functions (callee_map, function name -> callees) are added as skeletons
+    with the budget left. functions which don't fit even as a skeleton are left out
+    '''
+    code_map, token_count = {}, 0
+
+    def add(name, code_list):
+        nonlocal token_count
+        for code in code_list:
+            code_tokens = count_tokens(code, model_name)
+            if code and token_count + code_tokens <= token_budget:
+                code_map[name] = code
+                token_count += code_tokens
+                return
+
+    for name in name_list:
+        add(name, [workspace_client.fetch_function_code(name), workspace_client.fetch_function_skeleton(name)])
+
+    for name in name_list:
+        for callee in (callee_map or {}).get(name, []):
+            if callee not in code_map:
+                add(callee, [workspace_client.fetch_function_skeleton(callee)])
+
+    return code_map
+
+
+def get_summary_code(workspace_client: CodeWorkspaceClient, name, token_budget, model_name=OpenAIModel.gpt_turbo.model):
+    # full code of the function being summarized, cut at the token budget
+    return truncate_text(workspace_client.fetch_function_code(name), token_budget, model_name)
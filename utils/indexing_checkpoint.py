@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class SymbolState:
+    function_name: str
+    code_hash: str = None
+    summary: str = None
+    short_desc: str = None
+    vector: np.ndarray = None
+    stored: bool = False
+
+
+# columns of the checkpoint table which are updated by the pipeline stages
+STATE_FIELD_LIST = ['code_hash', 'summary', 'short_desc', 'vector', 'stored']
+
+
+class IndexingCheckpoint:
+    '''
+    durable state of the symbols of an indexing run (summarized, short description, embedded and stored
+    in the vector DB), so that a failed run can be resumed without regenerating the finished work.
+    updates are buffered and written in batches of batch_size, flush (or close) writes the rest of them
+    '''
+    def __init__(self, path, batch_size):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending_map = {}   # function name -> fields updated since the last flush
+
+        checkpoint_dir = os.path.dirname(path)
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+        # the pipeline stages update the checkpoint from multiple threads
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS symbol_state (function_name TEXT PRIMARY KEY, code_hash TEXT, summary TEXT, \
+                          short_desc TEXT, vector BLOB, stored INTEGER)')
+        self.conn.commit()
+
+    def update(self, function_name, replace=False, **kwargs):
+        # None values don't overwrite the stored state, unless the whole state of the function is replaced
+        with self.lock:
+            if replace:
+                self.pending_map[function_name] = dict(kwargs, replace=True)
+                pending = self.pending_map[function_name]
+            else:
+                pending = self.pending_map.setdefault(function_name, {})
+                pending.update({k: v for k, v in kwargs.items() if v is not None})
+            if len(self.pending_map) >= self.batch_size:
+                self._flush()
+
+    def update_many(self, function_name_list, **kwargs):
+        with self.lock:
+            for function_name in function_name_list:
+                self.pending_map.setdefault(function_name, {}).update(kwargs)
+            if len(self.pending_map) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        row_list, replace_row_list = [], []
+        for function_name, pending in self.pending_map.items():
+            row = [function_name]
+            for field in STATE_FIELD_LIST:
+                value = pending.get(field, None)
+                if field == 'vector' and value is not None:
+                    value = np.asarray(value, dtype=np.float32).tobytes()
+                elif field == 'stored' and value is not None:
+                    value = int(value)
+                row.append(value)
+            (replace_row_list if pending.get('replace', False) else row_list).append(row)
+
+        column_list = ', '.join(STATE_FIELD_LIST)
+        update_clause = ', '.join(f"{field} = COALESCE(excluded.{field}, {field})" for field in STATE_FIELD_LIST)
+        self.conn.executemany(f"INSERT OR REPLACE INTO symbol_state (function_name, {column_list}) VALUES (?, ?, ?, ?, ?, ?)", replace_row_list)
+        self.conn.executemany(f"INSERT INTO symbol_state (function_name, {column_list}) VALUES (?, ?, ?, ?, ?, ?) \
+                              ON CONFLICT (function_name) DO UPDATE SET {update_clause}", row_list)
+        self.conn.commit()
+        self.pending_map = {}
+
+    def flush(self):
+        with self.lock:
+            if len(self.pending_map):
+                self._flush()
+
+    def load(self):
+        # function name -> state of all the checkpointed symbols
+        self.flush()
+        state_map = {}
+        with self.lock:
+            row_list = self.conn.execute(f"SELECT function_name, {', '.join(STATE_FIELD_LIST)} FROM symbol_state").fetchall()
+            for function_name, code_hash, summary, short_desc, vector, stored in row_list:
+                vector = np.frombuffer(vector, dtype=np.float32) if vector is not None else None
+                state_map[function_name] = SymbolState(function_name, code_hash, summary, short_desc, vector, bool(stored))
+        return state_map
+
+    def clear(self):
+        with self.lock:
+            self.pending_map = {}
+            self.conn.execute('DELETE FROM symbol_state')
+            self.conn.commit()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
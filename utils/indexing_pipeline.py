@@ -0,0 +1,223 @@
+import contextvars
+import queue
+import threading
+import time
+
+from repo.vector_repo.base import VectorDB
+from settings import INDEXING_DB_BATCH_SIZE, INDEXING_EMBEDDING_BATCH_SIZE, INDEXING_FLUSH_INTERVAL, INDEXING_QUEUE_SIZE, \
+    INDEXING_SHORT_DESC_WORKERS
+from utils.ai_agent.ai_agent import AIAgent
+from utils.indexing_checkpoint import IndexingCheckpoint
+from utils.instrumentation import instrumentation
+
+
+# marks the end of the input of a stage
+_STOP = object()
+# time after which a blocked put/get checks if the pipeline was aborted
+POLL_INTERVAL = 0.1
+
+
+class IndexingPipeline:
+    '''
+    indexes the function summaries as they are produced. every submitted summary goes through two
+    concurrent stages, short description (a pool of workers) and embedding (micro batched), and is
+    written to the DB in batches once both are done. all the queues are bounded, so submit blocks
+    when the later stages fall behind. the first error in any stage aborts the pipeline and is raised
+    from submit/close. the state of every function is recorded in the checkpoint (if given)
+
+        with IndexingPipeline(ai_agent, db_client) as pipeline:
+            pipeline.submit(function_name, summary, code_hash)
+    '''
+    def __init__(self, ai_agent: AIAgent, db_client: VectorDB, checkpoint: IndexingCheckpoint = None, queue_size=INDEXING_QUEUE_SIZE,
+                 short_desc_workers=INDEXING_SHORT_DESC_WORKERS, embedding_batch_size=INDEXING_EMBEDDING_BATCH_SIZE,
+                 db_batch_size=INDEXING_DB_BATCH_SIZE, flush_interval=INDEXING_FLUSH_INTERVAL):
+        self.ai_agent = ai_agent
+        self.db_client = db_client
+        self.checkpoint = checkpoint
+        self.short_desc_workers = short_desc_workers
+        self.embedding_batch_size = embedding_batch_size
+        self.db_batch_size = db_batch_size
+        self.flush_interval = flush_interval
+
+        self.short_desc_queue = queue.Queue(maxsize=queue_size)
+        self.embedding_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+
+        self.pending_map = {}   # function name -> data of the function, till both the stages are done
+        self._lock = threading.Lock()
+        self._abort_event = threading.Event()
+        self.error = None
+        self.written_count = 0
+        self._stage_thread_list = []
+        self._writer_thread = None
+
+    def _start_thread(self, target, name):
+        # the stages run in a copy of the current context so that their calls are instrumented
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run_stage, target), name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def start(self):
+        for idx in range(self.short_desc_workers):
+            self._stage_thread_list.append(self._start_thread(self._short_desc_worker, f"short-desc-{idx}"))
+        self._stage_thread_list.append(self._start_thread(self._embedding_worker, "embedding"))
+        self._writer_thread = self._start_thread(self._writer, "db-writer")
+        return self
+
+    def _run_stage(self, target):
+        try:
+            target()
+        except BaseException as e:
+            self.abort(e)
+
+    def abort(self, error=None):
+        with self._lock:
+            if self.error is None and error is not None:
+                self.error = error
+        self._abort_event.set()
+
+    def _raise_if_aborted(self):
+        if self._abort_event.is_set():
+            raise self.error or RuntimeError("indexing pipeline was aborted")
+
+    def _put(self, q: queue.Queue, item):
+        # blocks while the queue is full (backpressure), unless the pipeline is aborted
+        while True:
+            self._raise_if_aborted()
+            try:
+                q.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue, timeout):
+        # next item of the queue, None if nothing arrived before the timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            self._raise_if_aborted()
+            try:
+                return q.get(timeout=max(min(POLL_INTERVAL, deadline - time.monotonic()), 0))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    return None
+
+    def _get_batch(self, q: queue.Queue, batch_size):
+        '''
+        micro batch of at most batch_size items, waits for the first item and then at most flush_interval
+        for the batch to fill up. returns (batch, is_stopped)
+        '''
+        batch = []
+        item = self._get(q, float('inf'))
+        deadline = time.monotonic() + self.flush_interval
+        while item is not _STOP:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                return batch, False
+            item = self._get(q, max(deadline - time.monotonic(), 0))
+            if item is None:
+                return batch, False
+        return batch, True
+
+    def submit(self, function_name, summary, code_hash=None, short_desc=None, vector=None):
+        # the stages whose output is given (from the checkpoint of a previous run) are skipped
+        if self.checkpoint:
+            self.checkpoint.update(function_name, replace=True, code_hash=code_hash, summary=summary, short_desc=short_desc, vector=vector)
+
+        data = dict(function_name=function_name, summary=summary, code_hash=code_hash)
+        if short_desc is not None:
+            data["short_desc"] = short_desc
+        if vector is not None:
+            data["vector"] = vector
+        if short_desc is not None and vector is not None:
+            self._put(self.write_queue, data)
+            return
+
+        with self._lock:
+            self.pending_map[function_name] = data
+        if short_desc is None:
+            self._put(self.short_desc_queue, function_name)
+        if vector is None:
+            self._put(self.embedding_queue, function_name)
+
+    def _complete(self, function_name, **kwargs):
+        # adds the output of a stage, the function is sent for writing once it has all of them
+        if self.checkpoint:
+            self.checkpoint.update(function_name, **kwargs)
+        with self._lock:
+            data = self.pending_map[function_name]
+            data.update(kwargs)
+            if 'short_desc' not in data or 'vector' not in data:
+                return
+            del self.pending_map[function_name]
+        self._put(self.write_queue, data)
+
+    def _short_desc_worker(self):
+        while True:
+            function_name = self._get(self.short_desc_queue, float('inf'))
+            if function_name is _STOP:
+                return
+
+            with instrumentation.stage("short_desc"):
+                short_desc = self.ai_agent.generate_short_desc(self.pending_map[function_name]["summary"])
+            self._complete(function_name, short_desc=short_desc)
+
+    def _embedding_worker(self):
+        is_stopped = False
+        while not is_stopped:
+            batch, is_stopped = self._get_batch(self.embedding_queue, self.embedding_batch_size)
+            if not len(batch):
+                continue
+
+            with instrumentation.stage("embed"):
+                vector_list = self.ai_agent.get_text_embeddings([self.pending_map[function_name]["summary"] for function_name in batch])
+            for function_name, vector in zip(batch, vector_list):
+                self._complete(function_name, vector=vector)
+
+    def _writer(self):
+        is_stopped = False
+        while not is_stopped:
+            batch, is_stopped = self._get_batch(self.write_queue, self.db_batch_size)
+            if not len(batch):
+                continue
+
+            with instrumentation.stage("db_write"):
+                self.db_client.upsert_vector_data(batch)
+            self.written_count += len(batch)
+            if self.checkpoint:
+                self.checkpoint.update_many([data["function_name"] for data in batch], stored=True)
+
+    def close(self):
+        '''
+        waits for all the submitted functions to be written, raises the error of the pipeline (if any)
+        '''
+        try:
+            for _ in range(self.short_desc_workers):
+                self._put(self.short_desc_queue, _STOP)
+            self._put(self.embedding_queue, _STOP)
+            for thread in self._stage_thread_list:
+                thread.join()
+
+            # every stage is done, so nothing else will be added for writing
+            self._put(self.write_queue, _STOP)
+            self._writer_thread.join()
+        finally:
+            self.abort()
+            for thread in self._stage_thread_list + [self._writer_thread]:
+                thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # not waiting for the remaining functions when the producer failed
+            self.abort(exc_value)
+            for thread in self._stage_thread_list + [self._writer_thread]:
+                thread.join()
+            return False
+
+        self.close()
+        return False
@@ -0,0 +1,134 @@
+import contextvars
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+
+from settings import INSTRUMENTATION_LIVE
+from utils.ai_agent.constants import get_model_cost
+
+
+# stage in which the LLM/embedding calls of the current thread are recorded
+current_stage = contextvars.ContextVar("current_stage", default=None)
+
+UNSTAGED = "unstaged"
+LIVE_LINE_INTERVAL = 0.5    # in seconds
+
+
+@dataclass
+class StageStats:
+    wall_time: float = 0    # in seconds, time during which the stage was running in at least one thread
+    busy_time: float = 0    # in seconds, summed over all the threads running the stage
+    calls: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    cache_hits: int = 0
+    cost: float = 0         # estimated, in USD
+
+
+class Instrumentation:
+    '''
+    per stage metrics of a pipeline run. wall time and busy time are measured by the stage context manager
+    and the model calls made inside a stage (from any thread running in its context) are added to it.
+    when a stage runs concurrently (e.g. in the indexing pipeline workers) the overlapping time is counted
+    once in the wall time and for every thread in the busy time
+    '''
+    def __init__(self, live=False):
+        self.live = live
+        self.stats = {}
+        self._active_map = {}   # stage -> (number of threads running it, time since which it is running)
+        self._lock = threading.Lock()
+        self._last_live_line_at = 0
+
+    def _get_stats(self, stage):
+        if stage not in self.stats:
+            self.stats[stage] = StageStats()
+        return self.stats[stage]
+
+    @contextmanager
+    def stage(self, name):
+        token = current_stage.set(name)
+        start_time = time.perf_counter()
+        with self._lock:
+            active_count, active_since = self._active_map.get(name, (0, start_time))
+            self._active_map[name] = (active_count + 1, active_since)
+        try:
+            yield
+        finally:
+            current_stage.reset(token)
+            end_time = time.perf_counter()
+            with self._lock:
+                stats = self._get_stats(name)
+                stats.busy_time += end_time - start_time
+                active_count, active_since = self._active_map.pop(name)
+                if active_count > 1:
+                    self._active_map[name] = (active_count - 1, active_since)
+                else:
+                    stats.wall_time += end_time - active_since
+            self._print_live_line(force=True)
+
+    def record_call(self, model, tokens_in=0, tokens_out=0, cached=False, call_count=1):
+        with self._lock:
+            stats = self._get_stats(current_stage.get() or UNSTAGED)
+            stats.calls += call_count
+            stats.tokens_in += tokens_in
+            stats.tokens_out += tokens_out
+            stats.cache_hits += call_count if cached else 0
+            stats.cost += get_model_cost(model, tokens_in, tokens_out)
+        self._print_live_line()
+
+    def get_total(self):
+        total = StageStats()
+        for stats in self.stats.values():
+            for f in fields(StageStats):
+                if f.name not in ('wall_time', 'busy_time'):
+                    setattr(total, f.name, getattr(total, f.name) + getattr(stats, f.name))
+        return total
+
+    def get_report(self):
+        with self._lock:
+            stage_list = [dict(stage=stage, **asdict(stats)) for stage, stats in self.stats.items()]
+        return dict(stages=stage_list, total=asdict(self.get_total()))
+
+    def save_report(self, path):
+        # csv for .csv files, json otherwise
+        report_dir = os.path.dirname(path)
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+
+        report = self.get_report()
+        with open(path, 'w', newline='') as f:
+            if path.endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=['stage'] + [f.name for f in fields(StageStats)])
+                writer.writeheader()
+                writer.writerows(report["stages"])
+            else:
+                json.dump(report, f, indent=2)
+
+    def get_summary_line(self):
+        total = self.get_total()
+        stage = current_stage.get() or '-'
+        return f"[{stage}] calls: {total.calls} ({total.cache_hits} cached), tokens: {total.tokens_in} in / {total.tokens_out} out, cost: ${total.cost:.4f}"
+
+    def _print_live_line(self, force=False):
+        if not self.live:
+            return
+
+        now = time.monotonic()
+        if force or now - self._last_live_line_at >= LIVE_LINE_INTERVAL:
+            self._last_live_line_at = now
+            sys.stderr.write("\r\033[2K" + self.get_summary_line())
+            sys.stderr.flush()
+
+    def print_report(self):
+        print("\033[1;32mpipeline report\033[0m")
+        print(f"{'stage':<20}{'time (s)':>10}{'busy (s)':>10}{'calls':>8}{'cached':>8}{'tokens in':>12}{'tokens out':>12}{'cost ($)':>10}")
+        for row in self.get_report()["stages"]:
+            print(f"{row['stage']:<20}{row['wall_time']:>10.2f}{row['busy_time']:>10.2f}{row['calls']:>8}{row['cache_hits']:>8}{row['tokens_in']:>12}{row['tokens_out']:>12}{row['cost']:>10.4f}")
+
+
+instrumentation = Instrumentation(live=INSTRUMENTATION_LIVE)
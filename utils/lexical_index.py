@@ -0,0 +1,180 @@
+import hashlib
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+
+# bump this whenever the format of the saved index changes
+LEXICAL_INDEX_VERSION = 1
+
+WORD_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|[0-9]+')
+# parts of snake_case and camelCase identifiers, e.g. HTTPResponseCode -> HTTP, Response, Code
+IDENTIFIER_PART_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+STOP_WORDS = frozenset(['a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'if', 'in', 'is', 'it', 'its', 'of',
+                        'on', 'or', 'that', 'the', 'this', 'to', 'was', 'with', 'self', 'cls', 'def', 'class', 'return', 'none'])
+
+# BM25 parameters, the terms of the name are counted NAME_WEIGHT times
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 3
+
+
+def tokenize(text):
+    '''
+    lower cased words of the text, identifiers are kept whole (fetch_function_code) and also split
+    into their parts (fetch, function, code) so that both exact and partial mentions match
+    '''
+    token_list = []
+    for word in WORD_PATTERN.findall(text):
+        token = word.lower().strip('_')
+        if not token or token in STOP_WORDS:
+            continue
+        token_list.append(token)
+
+        part_list = IDENTIFIER_PART_PATTERN.findall(word)
+        if len(part_list) > 1:
+            token_list += [part.lower() for part in part_list if part.lower() not in STOP_WORDS]
+    return token_list
+
+
+@dataclass
+class LexicalDocument:
+    name: str       # function name of the row in the vector DB
+    title: str      # symbol name, weighted higher than the rest of the text
+    text: str       # signature, docstring and short description
+
+    @property
+    def key(self):
+        # the index is rebuilt when the key of any document changes
+        return hashlib.sha1(f"{self.title}\0{self.text}".encode('utf-8')).hexdigest()
+
+
+def _join(string_list):
+    return np.frombuffer('\n'.join(string_list).encode('utf-8'), dtype=np.uint8)
+
+
+def _split(buffer):
+    text = buffer.tobytes().decode('utf-8')
+    return text.split('\n') if text else []
+
+
+class LexicalIndex:
+    '''
+    BM25 inverted index over the function names, signatures, docstrings and short descriptions.
+    the postings are stored CSR style (term -> slice of document ids and term frequencies) in a
+    compressed npz file, so that loading it doesn't need any parsing
+    '''
+    def __init__(self, doc_names, doc_keys, doc_lengths, terms, term_offsets, posting_docs, posting_tfs):
+        self.doc_names = doc_names
+        self.doc_keys = doc_keys
+        self.doc_lengths = doc_lengths
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.posting_docs = posting_docs
+        self.posting_tfs = posting_tfs
+
+        self.term_ids = {term: idx for idx, term in enumerate(terms)}
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0
+
+    def __len__(self):
+        return len(self.doc_names)
+
+    @classmethod
+    def build(cls, document_list: List[LexicalDocument]):
+        posting_map = {}    # term -> {doc id: weighted term frequency}
+        doc_lengths = np.zeros(len(document_list), dtype=np.float32)
+        for doc_id, document in enumerate(document_list):
+            for weight, text in [(NAME_WEIGHT, document.title), (1, document.text)]:
+                for token in tokenize(text):
+                    postings = posting_map.setdefault(token, {})
+                    postings[doc_id] = postings.get(doc_id, 0) + weight
+                    doc_lengths[doc_id] += weight
+
+        terms = sorted(posting_map.keys())
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for idx, term in enumerate(terms):
+            term_offsets[idx + 1] = term_offsets[idx] + len(posting_map[term])
+
+        posting_docs = np.empty(term_offsets[-1], dtype=np.int32)
+        posting_tfs = np.empty(term_offsets[-1], dtype=np.float32)
+        for idx, term in enumerate(terms):
+            start, end = term_offsets[idx], term_offsets[idx + 1]
+            posting_docs[start:end] = list(posting_map[term].keys())
+            posting_tfs[start:end] = list(posting_map[term].values())
+
+        return cls([d.name for d in document_list], [d.key for d in document_list], doc_lengths, terms, term_offsets, posting_docs, posting_tfs)
+
+    def save(self, path):
+        index_dir = os.path.dirname(path)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+        # np.savez adds the extension to the path if it is missing
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, version=np.array([LEXICAL_INDEX_VERSION]), doc_names=_join(self.doc_names), doc_keys=_join(self.doc_keys),
+                            doc_lengths=self.doc_lengths, terms=_join(self.terms), term_offsets=self.term_offsets,
+                            posting_docs=self.posting_docs, posting_tfs=self.posting_tfs)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # None if the index is missing or was saved in an older format
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data["version"][0]) != LEXICAL_INDEX_VERSION:
+                    return None
+                return cls(_split(data["doc_names"]), _split(data["doc_keys"]), data["doc_lengths"], _split(data["terms"]),
+                           data["term_offsets"], data["posting_docs"], data["posting_tfs"])
+        except (OSError, ValueError, KeyError) as e:
+            print("unable to load the lexical index, rebuilding it: ", str(e))
+            return None
+
+    def search(self, query, limit):
+        '''
+        names of the documents best matching the query (at most limit of them) with their BM25 scores,
+        documents which don't contain any of the query terms are left out
+        '''
+        doc_count = len(self.doc_names)
+        if not doc_count or limit <= 0:
+            return []
+
+        scores = np.zeros(doc_count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term, None)
+            if term_id is None:
+                continue
+
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs, tfs = self.posting_docs[start:end], self.posting_tfs[start:end]
+            idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / self.avg_doc_length)
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + length_norm)
+
+        match_idx = np.flatnonzero(scores > 0)
+        if len(match_idx) > limit:
+            match_idx = match_idx[np.argpartition(-scores[match_idx], limit - 1)[:limit]]
+        match_idx = match_idx[np.argsort(-scores[match_idx], kind='stable')]
+        return [(self.doc_names[idx], float(scores[idx])) for idx in match_idx]
+
+    def search_batch(self, query_list, limit):
+        return [self.search(query, limit) for query in query_list]
+
+
+def get_lexical_index(path, document_list: List[LexicalDocument]) -> LexicalIndex:
+    '''
+    the index saved at the path if it was built from the same documents, otherwise it is built again and saved
+    '''
+    lexical_index = LexicalIndex.load(path)
+    if lexical_index is not None and dict(zip(lexical_index.doc_names, lexical_index.doc_keys)) == {d.name: d.key for d in document_list}:
+        return lexical_index
+
+    lexical_index = LexicalIndex.build(document_list)
+    lexical_index.save(path)
+    return lexical_index
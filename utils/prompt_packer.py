@@ -0,0 +1,58 @@
+import bisect
+from dataclasses import dataclass, field
+from typing import List
+
+from utils.ai_agent.constants import OpenAIModel
+from utils.tokenizer import count_tokens, truncate_text
+
+
+@dataclass
+class PromptChunk:
+    token_budget: int
+    token_count: int = 0
+    items: dict = field(default_factory=dict)
+
+    @property
+    def fill_ratio(self):
+        return self.token_count / self.token_budget if self.token_budget else 0
+
+
+def format_desc_entry(k, v):
+    # same format in which the function descriptions are added to the prompt
+    return f"{k} - {v}\n"
+
+
+def pack_dict_by_tokens(data: dict, token_budget, model_name=OpenAIModel.gpt_turbo.model) -> List[PromptChunk]:
+    '''
+    packs the entries of the dict into as few chunks as possible, each within the token budget.
+    entries are placed largest first into the fullest chunk which still has room for them (best fit decreasing).
+    an entry larger than the budget has its value truncated
+    '''
+    if token_budget <= 0:
+        raise ValueError(f"token budget should be positive, got {token_budget}")
+
+    entry_list = []
+    for k, v in data.items():
+        token_count = count_tokens(format_desc_entry(k, v), model_name)
+        if token_count > token_budget:
+            v = truncate_text(str(v), max(token_budget - count_tokens(format_desc_entry(k, ''), model_name), 0), model_name)
+            token_count = min(count_tokens(format_desc_entry(k, v), model_name), token_budget)
+        entry_list.append((token_count, k, v))
+    entry_list.sort(key=lambda entry: -entry[0])
+
+    chunk_list = []
+    free_space_list = []    # sorted (free tokens, chunk idx) of all the chunks
+    for token_count, k, v in entry_list:
+        pos = bisect.bisect_left(free_space_list, (token_count, -1))
+        if pos < len(free_space_list):
+            free_tokens, chunk_idx = free_space_list.pop(pos)
+        else:
+            chunk_list.append(PromptChunk(token_budget))
+            free_tokens, chunk_idx = token_budget, len(chunk_list) - 1
+
+        chunk = chunk_list[chunk_idx]
+        chunk.items[k] = v
+        chunk.token_count += token_count
+        bisect.insort(free_space_list, (free_tokens - token_count, chunk_idx))
+
+    return chunk_list
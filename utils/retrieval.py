@@ -0,0 +1,115 @@
+import numpy as np
+
+from repo.vector_repo.base import VectorDB
+from settings import RRF_K
+from utils.lexical_index import LexicalIndex
+
+
+RETRIEVAL_MODE_LIST = ['vector', 'lexical', 'hybrid']
+
+
+def _normalize(vectors):
+    norm = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norm, 1e-12)
+
+
+def mmr_rerank(query_vector, rows, limit, mmr_lambda, vector_list=None):
+    '''
+    maximal marginal relevance, picks rows which are similar to the query but not to the rows already picked.
+    mmr_lambda = 1 only considers the relevance and mmr_lambda = 0 only the diversity. vector_list (vectors
+    of the rows, in the same order) is used instead of the vectors of the rows if given
+    '''
+    if not len(rows):
+        return []
+
+    vector_list = vector_list if vector_list is not None else [row.vector for row in rows]
+    vectors = _normalize(np.asarray(vector_list, dtype=np.float32))
+    relevance = vectors @ _normalize(np.asarray(query_vector, dtype=np.float32))
+    max_similarity = np.zeros(len(rows), dtype=np.float32)
+    is_selected = np.zeros(len(rows), dtype=bool)
+
+    selected_idx_list = []
+    for _ in range(min(limit, len(rows))):
+        score = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        score[is_selected] = -np.inf
+        idx = int(np.argmax(score))
+        selected_idx_list.append(idx)
+        is_selected[idx] = True
+        max_similarity = np.maximum(max_similarity, vectors @ vectors[idx])
+
+    return [rows[idx] for idx in selected_idx_list]
+
+
+def reciprocal_rank_fusion(ranked_list_list, k):
+    # names ordered by the sum of 1 / (k + rank) over all the ranked lists they appear in
+    score_map = {}
+    for ranked_list in ranked_list_list:
+        for rank, name in enumerate(ranked_list):
+            score_map[name] = score_map.get(name, 0) + 1 / (k + rank + 1)
+    return sorted(score_map.keys(), key=lambda name: -score_map[name])
+
+
+def check_retrieval_mode(retrieval_mode):
+    if retrieval_mode not in RETRIEVAL_MODE_LIST:
+        raise ValueError(f"unsupported retrieval mode: {retrieval_mode}, expected one of {RETRIEVAL_MODE_LIST}")
+
+
+def get_similar_functions(db_client: VectorDB, query_matrix, limit, lexical_index: LexicalIndex = None, query_list=None, row_map=None):
+    '''
+    rows most similar to every query, at most limit of them. the vector results (query_matrix) and the lexical
+    results (query_list searched in the lexical index) are fused by reciprocal rank, either of them can be
+    None. row_map (function name -> row) is needed for the rows which are only found by the lexical index
+    '''
+    query_count = len(query_matrix) if query_matrix is not None else len(query_list)
+    vector_result_list = db_client.fetch_similar_vector_data_batch(query_matrix, limit) if query_matrix is not None else [[] for _ in range(query_count)]
+    if lexical_index is None:
+        return vector_result_list
+
+    lexical_result_list = lexical_index.search_batch(query_list, limit)
+    similar_row_list = []
+    for vector_rows, lexical_matches in zip(vector_result_list, lexical_result_list):
+        # rows of the vector results first, the ones only found by the lexical index are taken from row_map
+        vector_row_map = {row.function_name: row for row in vector_rows}
+        name_list = reciprocal_rank_fusion([list(vector_row_map.keys()), [name for name, _ in lexical_matches]], RRF_K)
+        row_list = [vector_row_map.get(name) or (row_map or {}).get(name) for name in name_list]
+        similar_row_list.append([row for row in row_list if row is not None][:limit])
+    return similar_row_list
+
+
+def get_candidate_functions(db_client: VectorDB, query_matrix, limit, mmr_lambda=None, lexical_index: LexicalIndex = None, query_list=None, row_map=None):
+    '''
+    functions most similar to any of the queries, at most limit of them. the results of all the
+    queries are merged rank by rank and optionally re-ranked for diversity using MMR (only with the
+    query vectors). see get_similar_functions for the lexical search
+    '''
+    query_count = len(query_matrix) if query_matrix is not None else len(query_list or [])
+    if not query_count:
+        return []
+
+    result_list = get_similar_functions(db_client, query_matrix, limit, lexical_index, query_list, row_map)
+    if not any(len(rows) for rows in result_list):
+        return []
+
+    candidate_map = {}
+    for rank in range(max(len(rows) for rows in result_list)):
+        for rows in result_list:
+            if rank < len(rows):
+                candidate_map.setdefault(rows[rank].function_name, rows[rank])
+    candidate_list = list(candidate_map.values())
+
+    if mmr_lambda is None:
+        return candidate_list[:limit]
+    if query_matrix is None:
+        print("no query vectors in the lexical retrieval mode, skipping the MMR re-ranking")
+        return candidate_list[:limit]
+
+    # rows only found by the lexical index can come without their vectors (e.g. faiss rows from fetch_all_data)
+    missing_name_list = [row.function_name for row in candidate_list if row.vector is None]
+    missing_vector_map = db_client.fetch_vectors(missing_name_list) if len(missing_name_list) else {}
+    vector_list = [row.vector if row.vector is not None else missing_vector_map.get(row.function_name, None) for row in candidate_list]
+    if any(vector is None for vector in vector_list):
+        print("unable to fetch the vectors of all the candidate functions, skipping the MMR re-ranking")
+        return candidate_list[:limit]
+
+    query_vector = _normalize(np.asarray(query_matrix, dtype=np.float32)).mean(axis=0)
+    return mmr_rerank(query_vector, candidate_list, limit, mmr_lambda, vector_list)
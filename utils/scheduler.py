@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+from typing import Dict, List
+
+
+def get_dependency_levels(tree: Dict[str, List[str]]) -> List[List[str]]:
+    '''
+    groups the nodes of a dependency tree (node -> nodes it depends on) into levels so
+    that every node only depends on the nodes present in the levels before it.
+    cycles are broken deterministically by scheduling the node with the least number
+    of pending dependencies first (ties broken by name)
+    '''
+    nodes = set(tree.keys())
+    for dependencies in tree.values():
+        nodes.update(dependencies)
+
+    pending_dependencies = {node: set(d for d in tree.get(node, []) if d != node) for node in nodes}
+    dependents = {}
+    for node, dependencies in pending_dependencies.items():
+        for dependency in dependencies:
+            dependents.setdefault(dependency, []).append(node)
+
+    levels = []
+    remaining = set(nodes)
+    ready = sorted(node for node in nodes if not pending_dependencies[node])
+    while len(remaining):
+        if not len(ready):
+            # every remaining node is part of (or depends on) a cycle
+            ready = [min(remaining, key=lambda node: (len(pending_dependencies[node]), node))]
+
+        levels.append(ready)
+        remaining.difference_update(ready)
+
+        next_ready = set()
+        for node in ready:
+            for dependent in dependents.get(node, []):
+                if dependent in remaining:
+                    pending_dependencies[dependent].discard(node)
+                    if not pending_dependencies[dependent]:
+                        next_ready.add(dependent)
+        ready = sorted(next_ready)
+
+    return levels
+
+
+def run_level_wise(levels: List[List[str]], func, callback, max_workers, level_callback=None):
+    '''
+    runs func on every node of a level concurrently, moving to the next level only after
+    all the nodes of the current level are done. callback is called with (node, result)
+    on the calling thread as soon as each result arrives (in the order of completion), before the next
+    level starts. level_callback (if given) is called after every level. func runs in a copy of the
+    calling context (to keep the context variables)
+    '''
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for level in levels:
+            future_map = {executor.submit(contextvars.copy_context().run, func, node): node for node in level}
+            for future in as_completed(future_map):
+                callback(future_map[future], future.result())
+
+            if level_callback:
+                level_callback()
@@ -1,82 +1,122 @@
-from settings import MAX_TREE_DEPTH
-from utils.ai_agent.ai_agent import get_ai_agent
-from utils.task_tree import TaskNode, print_level_wise_tree
-
-
-def is_solved_or_null(node):
-    return node == None or node.result != None
-
-def solve(task_node: TaskNode, debug=False):
-    ai_agent = get_ai_agent(debug=debug)
-
-    # generate sub-task tree
-    tree_height = MAX_TREE_DEPTH
-    queue = [task_node]
-    while len(queue):
-        next_level = []
-        tree_height -= 1
-        
-        for node in queue:
-            if tree_height and ai_agent.is_breakdown_of_task_needed(node.task):
-                sub_task_data = ai_agent.breakdown_into_subtask(node.task)
-                sub_task_list = sub_task_data.split(';')
-
-                first = TaskNode(sub_task_list[0]) if len(sub_task_list) else None
-                second = TaskNode(sub_task_list[1]) if len(sub_task_list) > 1 else None
-                third = TaskNode(sub_task_list[2]) if len(sub_task_list) > 2 else None 
-                
-                first and next_level.append(first)
-                second and next_level.append(second)
-                third and next_level.append(third)
-
-                node.first = first
-                node.second = second
-                node.third = third
-        
-        queue = next_level
-        print("new tasks created: ", [x.task for x in queue])
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from settings import MAX_TREE_DEPTH, SOLVER_CONCURRENCY
+from utils.ai_agent.ai_agent import AIAgent, get_ai_agent
+from utils.scheduler import get_dependency_levels, run_level_wise
+from utils.task_tree import TaskNode, load_task_tree, normalize_task, print_level_wise_tree, save_task_tree
+
+
+# the agent is created once and shared by all the solve calls
+@lru_cache(maxsize=None)
+def get_solver_agent(debug=False) -> AIAgent:
+    return get_ai_agent(debug=debug)
+
+def expand_node(node: TaskNode, ai_agent: AIAgent):
+    if not ai_agent.is_breakdown_of_task_needed(node.task):
+        return
+
+    sub_task_data = ai_agent.breakdown_into_subtask(node.task)
+    node.children = [TaskNode(sub_task.strip()) for sub_task in sub_task_data.split(';') if sub_task.strip()]
+
+def solve_node(node: TaskNode, ai_agent: AIAgent):
+    data = ''
+    for child in node.children:
+        data += child.result or ''
+
+    data = data if data else None
+
+    return ai_agent.solve_task(node.task, data)
+
+def solve(task_node: TaskNode, debug=False, ai_agent: AIAgent=None, max_workers=SOLVER_CONCURRENCY, checkpoint_path=None):
+    '''
+    breaks the task into a tree of sub-tasks and solves it bottom up. sub-tasks which are repeated
+    in different branches are expanded and solved only once. if a checkpoint_path is given the
+    progress is saved after every level and a later call with the same task resumes from it
+    '''
+    ai_agent = ai_agent or get_solver_agent(debug)
+
+    # depth till which the tree has been expanded
+    expanded_depth = 0
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        saved_node, checkpoint = load_task_tree(checkpoint_path)
+        if normalize_task(saved_node.task) == normalize_task(task_node.task):
+            task_node.children, task_node.result = saved_node.children, saved_node.result
+            expanded_depth = checkpoint["expanded_depth"]
+
+    def save_checkpoint():
+        if checkpoint_path:
+            save_task_tree(task_node, checkpoint_path, expanded_depth=expanded_depth)
+
+    # generate sub-task tree, expanding all the nodes of a level at once
+    node_list = []
+    representative_map = {}     # normalized task -> first node with that task
+    leaf_map = {}               # normalized task -> first node not expanded for being the same as one of its ancestors
+    duplicate_map = {}          # id of a repeated node -> node with the same task
+    depth = 0
+    queue = [(task_node, frozenset())]  # node and the normalized tasks of its ancestors
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(queue):
+            expand_list = []
+            for node, ancestor_task_set in queue:
+                node_list.append(node)
+                normalized_task = normalize_task(node.task)
+                # a sub-task same as one of its ancestors is not expanded again, it is solved as a leaf
+                # (once for all such nodes, they can't reuse the result of the ancestor which depends on them)
+                if normalized_task in ancestor_task_set:
+                    if normalized_task in leaf_map:
+                        duplicate_map[id(node)] = leaf_map[normalized_task]
+                    else:
+                        leaf_map[normalized_task] = node
+                    continue
+
+                if normalized_task in representative_map:
+                    duplicate_map[id(node)] = representative_map[normalized_task]
+                    continue
+
+                representative_map[normalized_task] = node
+                if depth >= expanded_depth and depth < MAX_TREE_DEPTH - 1:
+                    expand_list.append(node)
+
+            list(executor.map(lambda node: expand_node(node, ai_agent), expand_list))
+            if len(expand_list):
+                expanded_depth = depth + 1
+                save_checkpoint()
+
+            next_queue = []
+            for node, ancestor_task_set in queue:
+                if id(node) not in duplicate_map:
+                    child_ancestor_task_set = ancestor_task_set | {normalize_task(node.task)}
+                    next_queue.extend((child, child_ancestor_task_set) for child in node.children)
+
+            queue = next_queue
+            depth += 1
+            print("new tasks created: ", [x.task for x, _ in queue])
 
 
     # print_level_wise_tree(task_node)
 
-    # get task results and combine the answer
-    def recursive_solver(node: TaskNode):
-        if not node:
-            return
-        
-        if not (is_solved_or_null(node.first) and is_solved_or_null(node.second) and is_solved_or_null(node.third)):
-            recursive_solver(node.first)
-            recursive_solver(node.second)
-            recursive_solver(node.third)
-            
-        data = ''
-        data += node.first.result if node.first else ''
-        data += node.second.result if node.second else ''
-        data += node.third.result if node.third else ''
-
-        data = data if data else None
-
-        res = ai_agent.solve_task(node.task, data)
-        node.result = res
-
-    recursive_solver(task_node)
+    # get task results and combine the answer, a task is solved as soon as all of its sub-tasks are solved.
+    # repeated tasks wait for the first node with the same task and reuse its result
+    dependency_tree = {}
+    node_idx_map = {id(node): idx for idx, node in enumerate(node_list)}
+    for idx, node in enumerate(node_list):
+        if id(node) in duplicate_map:
+            dependency_tree[idx] = [node_idx_map[id(duplicate_map[id(node)])]]
+        else:
+            dependency_tree[idx] = [node_idx_map[id(child)] for child in node.children]
+
+    def solve_idx(idx):
+        node = node_list[idx]
+        if id(node) in duplicate_map:
+            return duplicate_map[id(node)].result
+        return solve_node(node, ai_agent)
+
+    def update_result(idx, result):
+        node_list[idx].result = result
+
+    levels = get_dependency_levels(dependency_tree)
+    levels = [[idx for idx in level if node_list[idx].result is None] for level in levels]
+    run_level_wise(levels, solve_idx, update_result, max_workers, save_checkpoint)
     return task_node.result
-
-def break_dict_by_length(data, max_chars):
-    result = []
-    current = {}
-    current_chars = 0
-
-    for k, v in data.items():
-        item_chars = len(str(k)) + len(str(v))
-        if current_chars + item_chars > max_chars:
-            result.append(current)
-            current = {}
-            current_chars = 0
-        current[k] = v
-        current_chars += item_chars
-
-    if current:
-        result.append(current)
-
-    return result
@@ -0,0 +1,406 @@
+import ast
+import hashlib
+import json
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List
+
+
+# bump this whenever the per file data format changes so that old indexes are rebuilt
+INDEX_VERSION = 10
+
+# files larger than this are memory mapped instead of being read in memory
+MMAP_MIN_FILE_SIZE = 1024 * 1024
+# changed files are parsed in a process pool only when there are at least these many
+PARALLEL_PARSE_MIN_FILES = 16
+
+LINE_END_PATTERN = re.compile(r'(?<=\n)|(?<=\r)(?!\n)')
+# longest code (in lines) kept for a class usage, longer statements are cut
+MAX_USAGE_LINES = 8
+# number of files whose lines are kept in memory for reading the source of the symbols
+SOURCE_CACHE_FILES = 16
+
+
+@dataclass
+class Symbol:
+    name: str           # module qualified name e.g. utils.codemap:CodeWorkspaceClient.fetch_function_code
+    kind: str           # 'function' or 'class'
+    file_path: str
+    start_line: int
+    end_line: int
+    signature: str = ''     # def/class line(s) without the body
+    docstring: str = ''
+    code_hash: str = ''     # hash of the source, computed while parsing so that unchanged files are not read
+
+    @property
+    def source(self):
+        # only the line span is indexed, the code is read from the file when needed
+        return ''.join(get_file_lines(self.file_path)[self.start_line - 1:self.end_line]).strip()
+
+    @property
+    def qualname(self):
+        return split_symbol_name(self.name)[1]
+
+    @property
+    def short_name(self):
+        return get_short_name(self.name)
+
+
+@lru_cache(maxsize=SOURCE_CACHE_FILES)
+def _read_file_lines(file_path, mtime_ns, size):
+    with open(file_path, 'rb') as f:
+        return LINE_END_PATTERN.split(f.read().decode('utf-8'))
+
+
+def get_file_lines(file_path):
+    # lines of the file as counted by the parser, cached till the file is modified
+    stat = os.stat(file_path)
+    return _read_file_lines(file_path, stat.st_mtime_ns, stat.st_size)
+
+
+def split_symbol_name(name):
+    '''
+    splits utils.codemap:CodeWorkspaceClient.fetch_function_code into its module and qualified name,
+    the module is empty for names which are not module qualified
+    '''
+    module_name, _, qualname = name.rpartition(':')
+    return module_name, qualname
+
+
+def get_class_name(name):
+    # module qualified name of the class a method belongs to, None for functions
+    module_name, qualname = split_symbol_name(name)
+    if '.' not in qualname:
+        return None
+
+    class_name = qualname.rsplit('.', 1)[0]
+    return module_name + ':' + class_name if module_name else class_name
+
+
+def get_short_name(name):
+    return split_symbol_name(name)[1].split('.')[-1]
+
+
+def get_module_name(file_path, root):
+    module_path = os.path.splitext(os.path.relpath(file_path, root))[0]
+    module_name = module_path.replace(os.sep, '.')
+    if module_name.endswith('.__init__'):
+        module_name = module_name[:-len('.__init__')]
+    return module_name
+
+
+def get_dotted_name(node):
+    # utils.codemap.fetch for nested attribute access on a name, None for anything else
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+
+    parts.append(node.id)
+    return '.'.join(reversed(parts))
+
+
+def add_import(imports, node, module_name, is_package=False):
+    '''
+    adds the names imported by an import statement to the imports of a module, mapping them to what they refer
+    to, 'pkg.mod' for modules and 'pkg.mod:name' for names imported from a module. relative imports are
+    resolved using the module name
+    '''
+    if isinstance(node, ast.Import):
+        for alias in node.names:
+            if alias.asname:
+                imports[alias.asname] = alias.name
+            else:
+                # import a.b makes only a available
+                imports[alias.name.split('.')[0]] = alias.name.split('.')[0]
+        return
+
+    package_parts = module_name.split('.') if module_name else []
+    if node.level:
+        package_parts = package_parts if is_package else package_parts[:-1]
+        package_parts = package_parts[:len(package_parts) - node.level + 1]
+    else:
+        package_parts = []
+    base = '.'.join(package_parts + ([node.module] if node.module else []))
+    for alias in node.names:
+        if alias.name != '*':
+            imports[alias.asname or alias.name] = base + ':' + alias.name
+
+
+def get_source_segment(line_list, node):
+    '''
+    same as ast.get_source_segment, but takes the lines of the source so that they are not
+    split again for every node. the column offsets are in utf-8 bytes
+    '''
+    first, last = node.lineno - 1, node.end_lineno - 1
+    if first == last:
+        return line_list[first].encode('utf-8')[node.col_offset:node.end_col_offset].decode('utf-8')
+
+    segment_list = [line_list[first].encode('utf-8')[node.col_offset:].decode('utf-8')]
+    segment_list += line_list[first + 1:last]
+    segment_list.append(line_list[last].encode('utf-8')[:node.end_col_offset].decode('utf-8'))
+    return ''.join(segment_list)
+
+
+def get_code_hash(source):
+    # same as the hash of CodeWorkspaceClient.fetch_function_code for a single symbol
+    return hashlib.sha1((source + '\n').encode('utf-8')).hexdigest()
+
+
+def get_signature(line_list, node):
+    # header of a function/class definition, from its first decorator till the start of its body.
+    # the indentation of the definition is removed from all of its lines
+    first, body = min([decorator.lineno for decorator in node.decorator_list] + [node.lineno]) - 1, node.body[0]
+    # the body starts at the decorators of its first statement (a decorated method of a class), which are
+    # at the same column as the statement. the line it starts on is kept till the body (def f(): pass)
+    body_first = min([decorator.lineno for decorator in getattr(body, 'decorator_list', [])] + [body.lineno]) - 1
+    header_line_list = line_list[first:body_first] + [line_list[body_first].encode('utf-8')[:body.col_offset].decode('utf-8')]
+    # comments and blank lines between the header and the body
+    while len(header_line_list) > 1 and header_line_list[-1].strip()[:1] in ('', '#'):
+        header_line_list.pop()
+    indent = node.col_offset
+    header = ''.join(line[indent:] if not line[:indent].strip() else line.lstrip() for line in header_line_list)
+    return header.strip()
+
+
+def get_skeleton(symbol: Symbol, member_list=(), indent='    '):
+    '''
+    signature and docstring of a function/class without its body, along with the skeletons of
+    the given members (methods of a class)
+    '''
+    line_list = [symbol.signature]
+    if symbol.docstring:
+        line_list.append(indent + '"""' + symbol.docstring.replace('\n', '\n' + indent) + '"""')
+    for member in member_list:
+        line_list += [indent + line for line in get_skeleton(member, (), indent).split('\n')]
+    if not len(member_list):
+        line_list.append(indent + '...')
+    return '\n'.join(line_list)
+
+
+def get_usage_context(parent, call):
+    # how the result of a call is used, 'assign' (x = Cls()), 'return', 'keyword' (f(x=Cls())) or 'call' for anything else
+    if isinstance(parent, (ast.Assign, ast.AnnAssign)) and parent.value is call:
+        return 'assign'
+    if isinstance(parent, ast.Return):
+        return 'return'
+    if isinstance(parent, ast.keyword):
+        return 'keyword'
+    return 'call'
+
+
+def get_usage_code(line_list, statement, call):
+    # statement in which a class is used, only the call itself if the statement is too long
+    code = get_source_segment(line_list, statement)
+    if code.count('\n') >= MAX_USAGE_LINES:
+        code = get_source_segment(line_list, call)
+    return '\n'.join(code.split('\n')[:MAX_USAGE_LINES])
+
+
+def parse_file(source, module_name, is_package=False):
+    tree = ast.parse(source)
+    # lines as counted by the parser (form feeds and other unicode line breaks don't end a line)
+    line_list = LINE_END_PATTERN.split(source)
+
+    # a single pass over the tree collects
+    # - all the functions and classes (including nested ones) with their line span, signature and docstring
+    # - names called by every function/method, calls made inside nested functions belong to the enclosing one
+    # - calls to capitalized names (class instantiations by convention), with the statement they are made in
+    # - the imported names (including the ones imported inside functions)
+    symbols, calls, class_bases, class_usages, imports = [], {}, {}, [], {}
+    def visit(node, scope, class_scope, current_func, statement):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                is_class = isinstance(child, ast.ClassDef)
+                symbols.append([
+                    module_name + ':' + '.'.join(scope + [child.name]),
+                    'class' if is_class else 'function',
+                    child.lineno,
+                    child.end_lineno,
+                    get_signature(line_list, child),
+                    ast.get_docstring(child) or '',
+                    get_code_hash(''.join(line_list[child.lineno - 1:child.end_lineno]).strip())
+                ])
+                # the usages in decorators and default values are not recorded
+                if current_func is not None:
+                    visit(child, scope + [child.name], class_scope, current_func, None)
+                elif is_class:
+                    class_bases['.'.join(class_scope + [child.name])] = [b for b in map(get_dotted_name, child.bases) if b]
+                    visit(child, scope + [child.name], class_scope + [child.name], None, None)
+                else:
+                    func_qualname = '.'.join(class_scope + [child.name])
+                    calls[func_qualname] = set()
+                    visit(child, scope + [child.name], class_scope, func_qualname, None)
+                continue
+
+            if isinstance(child, ast.Call):
+                called_name = get_dotted_name(child.func)
+                if current_func is not None:
+                    calls[current_func].add(called_name)
+                if called_name and called_name.split('.')[-1][:1].isupper() and statement is not None:
+                    class_usages.append([called_name, child.lineno, get_usage_code(line_list, statement, child),
+                                         get_usage_context(node, child), len(child.keywords)])
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                add_import(imports, child, module_name, is_package)
+            visit(child, scope, class_scope, current_func, child if isinstance(child, ast.stmt) else statement)
+
+    visit(tree, [], [], None, None)
+    calls = {func: sorted(called_names - {None}) for func, called_names in calls.items()}
+
+    return {
+        "symbols": symbols,
+        "class_usages": class_usages,
+        "calls": calls,
+        "class_bases": class_bases,
+        "imports": imports
+    }
+
+
+def index_file(file_path, module_name, previous_hash=None):
+    '''
+    reads and parses a single file, large files are memory mapped. the file is not parsed again if its
+    hash matches the previous hash. runs in the worker processes so it only returns plain data
+    '''
+    try:
+        # decoding inside the try, so that a file which isn't valid utf-8 is reported and skipped
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_MIN_FILE_SIZE:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    content_hash = hashlib.sha1(content).hexdigest()
+                    if content_hash == previous_hash:
+                        return content_hash, None
+                    source = str(content, 'utf-8')
+            else:
+                content = f.read()
+                content_hash = hashlib.sha1(content).hexdigest()
+                if content_hash == previous_hash:
+                    return content_hash, None
+                source = content.decode('utf-8')
+
+        data = parse_file(source, module_name, os.path.basename(file_path) == '__init__.py')
+    except (SyntaxError, UnicodeDecodeError, ValueError) as e:
+        data = {"symbols": [], "class_usages": [], "calls": {}, "class_bases": {}, "imports": {}, "error": f"{type(e).__name__}: {str(e)}"}
+
+    return content_hash, data
+
+
+class SymbolIndex:
+    '''
+    single pass index of all the functions and classes present in the workspace.
+    every file is parsed only once and the result is persisted on the disk, keyed by the
+    file path, mtime, size and content hash so that only the changed files are parsed again
+    '''
+    def __init__(self, root, index_path=None, max_workers=None):
+        self.root = root
+        self.index_path = index_path
+        self.max_workers = max_workers
+        self.files = {}     # file path -> stat info and the parsed data of the file
+        self.symbols: Dict[str, Symbol] = {}
+        self.symbols_by_name: Dict[str, List[str]] = {}
+        self.members: Dict[str, List[str]] = {}    # class/function name -> names of the symbols defined directly in it
+        self._load()
+
+    def _load(self):
+        if not (self.index_path and os.path.exists(self.index_path)):
+            return
+
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print("unable to load the symbol index, rebuilding it: ", str(e))
+            return
+
+        if data.get("version") == INDEX_VERSION and data.get("root") == os.path.abspath(self.root):
+            self.files = data["files"]
+
+    def save(self):
+        if not self.index_path:
+            return
+
+        index_dir = os.path.dirname(self.index_path)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+        data = {
+            "version": INDEX_VERSION,
+            "root": os.path.abspath(self.root),
+            "files": self.files
+        }
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self, file_paths):
+        '''
+        updates the index for the given list of files, only parsing the files
+        which have changed since the last refresh
+        '''
+        files = {}
+        changed_file_list = []
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            entry = self.files.get(file_path)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                files[file_path] = entry
+            else:
+                changed_file_list.append((file_path, stat))
+
+        # every file is parsed separately so that only one file per worker is in memory at a time
+        args_list = [(file_path, get_module_name(file_path, self.root), (self.files.get(file_path) or {}).get("hash")) for file_path, _ in changed_file_list]
+        if len(args_list) >= PARALLEL_PARSE_MIN_FILES and self.max_workers != 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                result_list = list(executor.map(index_file, *zip(*args_list), chunksize=8))
+        else:
+            result_list = [index_file(*args) for args in args_list]
+
+        for (file_path, stat), (content_hash, data) in zip(changed_file_list, result_list):
+            # data is None when the content of the file hasn't changed
+            entry = self.files[file_path] if data is None else dict(hash=content_hash, **data)
+            entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+            files[file_path] = entry
+
+        if len(changed_file_list) or files.keys() != self.files.keys():
+            self.files = files
+            self.save()
+
+        self._build_lookup()
+
+    @property
+    def parse_errors(self):
+        # files which couldn't be parsed and were skipped
+        return {file_path: entry["error"] for file_path, entry in self.files.items() if entry.get("error")}
+
+    def get_module_data(self):
+        # parsed data of every module, keyed by the module name
+        return {get_module_name(file_path, self.root): entry for file_path, entry in self.files.items()}
+
+    def _build_lookup(self):
+        self.symbols, self.symbols_by_name, self.members = {}, {}, {}
+        for file_path, entry in self.files.items():
+            for name, kind, start_line, end_line, signature, docstring, code_hash in entry["symbols"]:
+                symbol = Symbol(name, kind, file_path, start_line, end_line, signature, docstring, code_hash)
+                self.symbols[name] = symbol
+                self.symbols_by_name.setdefault(symbol.short_name, []).append(name)
+                if get_class_name(name):
+                    self.members.setdefault(get_class_name(name), []).append(name)
+
+    def get_symbol(self, name):
+        return self.symbols.get(name, None)
+
+    def get_members(self, name) -> List[Symbol]:
+        return [self.symbols[n] for n in self.members.get(name, [])]
+
+    def find_symbols(self, name) -> List[Symbol]:
+        '''
+        all the symbols matching the given name, irrespective of the module or class they belong to
+        '''
+        return [self.symbols[n] for n in self.symbols_by_name.get(get_short_name(name), [])]
@@ -1,29 +1,67 @@
+import json
+import os
+
+
 class TaskNode:
-    def __init__(self, task, first=None, second=None, third=None):
+    __slots__ = ('task', 'children', 'result', 'priority_level')
+
+    def __init__(self, task, children=None):
         self.task = task
-        self.first = first
-        self.second = second
-        self.third = third
+        self.children = children if children is not None else []
         self.result = None
         self.priority_level = 1     # ranges from 1 to 10
 
+    def to_dict(self):
+        return {
+            "task": self.task,
+            "result": self.result,
+            "priority_level": self.priority_level,
+            "children": [child.to_dict() for child in self.children]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        node = cls(data["task"], [cls.from_dict(child) for child in data["children"]])
+        node.result = data["result"]
+        node.priority_level = data["priority_level"]
+        return node
+
+
+# tasks which only differ in case, whitespace or the trailing full stop are treated as the same task
+def normalize_task(task):
+    return ' '.join(task.lower().split()).rstrip('.')
+
+
+def save_task_tree(root: TaskNode, path, **kwargs):
+    data = dict(tree=root.to_dict(), **kwargs)
+
+    tree_dir = os.path.dirname(path)
+    if tree_dir:
+        os.makedirs(tree_dir, exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def load_task_tree(path):
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    root = TaskNode.from_dict(data.pop("tree"))
+    return root, data
+
 
 def print_level_wise_tree(root: TaskNode):
     if root is None:
         return
 
     current_level = [root]
-    
+
     while current_level:
         print([node.task for node in current_level])
 
         next_level = []
         for node in current_level:
-            if node.first is not None:
-                next_level.append(node.first)
-            if node.second is not None:
-                next_level.append(node.second)
-            if node.third is not None:
-                next_level.append(node.third)
-
-        current_level = next_level
\ No newline at end of file
+            next_level.extend(node.children)
+
+        current_level = next_level
@@ -0,0 +1,52 @@
+from functools import lru_cache
+
+
+# rough number of characters per token, used when tiktoken is not available
+CHARS_PER_TOKEN = 4
+
+# tokens added by the chat format for every message and for priming the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads the encoding files on first use
+        print("unable to load the tokenizer, estimating token counts: ", str(e))
+        return None
+
+
+def count_tokens(text, model_name):
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, model_name):
+    token_count = TOKENS_PER_REPLY
+    for message in messages:
+        token_count += TOKENS_PER_MESSAGE + count_tokens(message["content"], model_name)
+    return token_count
+
+
+def truncate_text(text, max_tokens, model_name):
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
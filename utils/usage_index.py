@@ -0,0 +1,57 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, List
+
+from utils.call_graph import CallResolver
+from utils.symbol_index import SymbolIndex, get_module_name, get_short_name
+
+
+# preference of the ways a class can be used in, an assignment shows best how the class is initialized
+USAGE_CONTEXT_SCORE_MAP = {'assign': 3, 'return': 2, 'keyword': 1, 'call': 0}
+
+
+@dataclass
+class ClassUsage:
+    class_name: str     # module qualified name of the class
+    file_path: str
+    line_no: int
+    code: str           # statement in which the class is initialized
+    context: str        # assign, return, keyword or call
+    keyword_count: int
+
+    @property
+    def score(self):
+        is_test_file = os.path.basename(self.file_path).startswith('test') or f"{os.sep}tests{os.sep}" in self.file_path
+        return USAGE_CONTEXT_SCORE_MAP.get(self.context, 0) + (1 if self.keyword_count else 0) - (2 if is_test_file else 0)
+
+
+class ClassUsageIndex:
+    '''
+    instantiation sites of every class of the workspace, ranked by how well they show the initialization
+    of the class. built from the calls recorded while parsing the symbol index (no files are read), the
+    called names (including the attribute qualified ones like module.Class) are resolved using the imports
+    '''
+    def __init__(self, symbol_index: SymbolIndex):
+        self.usages: Dict[str, List[ClassUsage]] = {}   # module qualified class name -> ranked usages
+        self.usages_by_name: Dict[str, List[str]] = {}  # short class name -> module qualified names
+
+        module_data_map = {get_module_name(file_path, symbol_index.root): entry for file_path, entry in symbol_index.files.items()}
+        resolver = CallResolver(module_data_map)
+        for file_path, entry in symbol_index.files.items():
+            module_name = get_module_name(file_path, symbol_index.root)
+            for called_name, line_no, code, context, keyword_count in entry["class_usages"]:
+                class_name = resolver.resolve(module_name, called_name)
+                if class_name and resolver.symbol_kind_map[class_name] == 'class':
+                    self.usages.setdefault(class_name, []).append(ClassUsage(class_name, file_path, line_no, code, context, keyword_count))
+
+        for class_name, usage_list in self.usages.items():
+            usage_list.sort(key=lambda usage: (-usage.score, usage.file_path, usage.line_no))
+            self.usages_by_name.setdefault(get_short_name(class_name), []).append(class_name)
+
+    def find_usages(self, class_name) -> List[ClassUsage]:
+        # usages of a module qualified class, or of all the classes with the given short name
+        if ':' in class_name:
+            return self.usages.get(class_name, [])
+
+        usage_list = [usage for name in self.usages_by_name.get(class_name, []) for usage in self.usages[name]]
+        return sorted(usage_list, key=lambda usage: (-usage.score, usage.file_path, usage.line_no))